@@ -0,0 +1,114 @@
+"""Memory used by DAO entities, before and after the compact representation.
+
+Usage: python benchmarks/bench_dao_memory.py [--count 10000]
+
+Prints a JSON document with the bytes allocated per entity for the previous
+dict based `DaoEntity` and for the current `__slots__` based one.
+"""
+
+import argparse
+import gc
+import json
+from pathlib import Path
+import sys
+import tracemalloc
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from custom_components.xiaotu_door.dao import DaoEntity  # noqa: E402
+
+
+class LegacyDaoEntity:
+    """The previous `DaoEntity`, keeping a full copy of the server data."""
+
+    def __init__(self, data: dict) -> None:
+        """Initialize entity."""
+        self.data = {}
+        self.data.update(data)
+
+
+def make_door(index: int) -> dict:
+    """Build a door record shaped like a `/wap/door/getDoor` result item.
+
+    Every record is parsed from its own JSON document, like the records of a
+    real response, so no strings are shared between records by accident.
+    """
+
+    return json.loads(
+        json.dumps(
+            {
+                "id": f"D{index:08d}",
+                "doorId": f"{index:012d}",
+                "name": f"Building {index // 20} Gate {index % 20}",
+                "type": "lock",
+                "_type": "1",
+                "doorType": "door",
+                "status": "0",
+                "isOpen": "2",
+                "villageId": "V0001",
+                "buildingId": f"B{index // 20:04d}",
+                "deviceSn": f"SN{index:016d}",
+                "createTime": "2023-01-01 00:00:00",
+                "sort": index,
+                "remark": "",
+                "image": f"https://img.example.com/door/{index}.jpg",
+                "imageItem": {
+                    "originalImage": f"https://img.example.com/door/{index}.jpg",
+                    "thumbnailImage": f"https://img.example.com/door/{index}_s.jpg",
+                    "width": 640,
+                    "height": 480,
+                },
+            }
+        )
+    )
+
+
+def measure(factory, count: int) -> int:
+    """Measure the bytes kept alive by `count` entities built by `factory`.
+
+    The server records are dropped once the entities are built, like the
+    response of a real request.
+    """
+
+    gc.collect()
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+
+    records = [make_door(index) for index in range(count)]
+    entities = [factory(record) for record in records]
+    del records
+    gc.collect()
+
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del entities
+
+    return size - baseline
+
+
+def main() -> None:
+    """Run the benchmark."""
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=10_000)
+    args = parser.parse_args()
+
+    cases = {
+        "legacy_dict": LegacyDaoEntity,
+        "slots": DaoEntity,
+        "slots_with_extras": lambda data: DaoEntity(data, keep_extras=True),
+    }
+
+    results = {}
+    for name, factory in cases.items():
+        size = measure(factory, args.count)
+        results[name] = {
+            "total_bytes": size,
+            "bytes_per_entity": round(size / args.count, 1),
+        }
+
+    print(json.dumps({"count": args.count, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+"""Benchmarks of the hot paths of the integration, against the mock servers.
+
+Usage: python benchmarks/bench_integration.py [--repeat 20] [--latency fixed:0.01]
+    [--output results.json] [--compare baseline.json]
+
+Runs the real config entry setup, `XiaoTuAccount`, `XiaoTuDevice`,
+`XiaoTuCoordinator` and `XiaoTuDoorLock` in a Home Assistant instance,
+against `mock_server.py`. Needs the test harness of Home Assistant, from
+`pytest-homeassistant-custom-component`.
+
+Cases:
+- cold_startup: from adding a config entry to its lock entities registered
+- unlock_warm_token: `lock.unlock` service call with a valid token
+- unlock_token_expired: `lock.unlock` service call after the token expired
+- refresh_<n>_doors: coordinator refresh with 10, 100 and 1000 doors
+- memory_per_account: memory kept by each set up config entry
+
+Prints a JSON document with the durations in seconds and the memory in
+bytes. With `--compare`, also prints the ratio of the medians to a
+previous result.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+from collections.abc import AsyncGenerator, Awaitable, Callable
+from contextlib import asynccontextmanager
+import gc
+import json
+from pathlib import Path
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from pytest_homeassistant_custom_component.common import (
+    MockConfigEntry,
+    async_test_home_assistant,
+)
+
+from homeassistant import loader
+from homeassistant.const import __version__ as HA_VERSION
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers import entity_registry as er
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+from custom_components.xiaotu_door.api import APIAuth  # noqa: E402
+from custom_components.xiaotu_door.const import DOMAIN  # noqa: E402
+from mock_server import Latency, MockConfig, MockXiaoTuServer  # noqa: E402
+
+try:
+    from custom_components.xiaotu_door.ratelimit import TokenBucket  # noqa: E402
+except ImportError:
+    # Before the request budgets, the same script runs on every commit
+    TokenBucket = None
+
+REFRESH_DOORS = (10, 100, 1000)
+
+
+def summarize(samples: list[float]) -> dict[str, float | int]:
+    """Get the headline numbers of duration samples."""
+
+    ordered = sorted(samples)
+    return {
+        "n": len(ordered),
+        "mean": round(statistics.fmean(ordered), 6),
+        "p50": round(statistics.median(ordered), 6),
+        "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 6),
+        "min": round(ordered[0], 6),
+        "max": round(ordered[-1], 6),
+    }
+
+
+@asynccontextmanager
+async def running(
+    doors: int, latency: Latency, config_dir: str
+) -> AsyncGenerator[tuple[HomeAssistant, MockXiaoTuServer]]:
+    """Run Home Assistant and the mock servers."""
+
+    server = MockXiaoTuServer(MockConfig(doors=doors, latency=latency, seed=1))
+    await server.start()
+
+    # Before the per-account auth, the token was kept on the class, and would
+    # be sent to the mock servers of the next case
+    APIAuth.token_id = ""
+
+    async with async_test_home_assistant(config_dir=config_dir) as hass:
+        hass.data.pop(loader.DATA_CUSTOM_COMPONENTS)
+        try:
+            yield hass, server
+        finally:
+            await hass.async_stop(force=True)
+            await server.stop()
+
+
+async def add_entry(
+    hass: HomeAssistant, server: MockXiaoTuServer, index: int = 0
+) -> MockConfigEntry:
+    """Set up a config entry, with the request budgets lifted.
+
+    The budgets would make the benchmarks measure the rate limits, not the
+    integration.
+    """
+
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        title=f"Bench {index}",
+        data={"host": server.url, "username": f"openid{index}", "password": "cid"},
+    )
+    entry.add_to_hass(hass)
+
+    assert await hass.config_entries.async_setup(entry.entry_id)
+    await hass.async_block_till_done()
+
+    rate_limiter = getattr(entry.coordinator.account.api, "rate_limiter", None)
+    if rate_limiter is not None and TokenBucket is not None:
+        for name in rate_limiter.buckets:
+            rate_limiter.buckets[name] = TokenBucket(1e6, 1e6)
+
+    return entry
+
+
+def get_lock_ids(hass: HomeAssistant, entry: MockConfigEntry) -> list[str]:
+    """Get the lock entities of a config entry."""
+
+    registry = er.async_get(hass)
+    return [
+        item.entity_id
+        for item in er.async_entries_for_config_entry(registry, entry.entry_id)
+        if item.domain == "lock"
+    ]
+
+
+async def timed(awaitable: Awaitable) -> float:
+    """Get the seconds spent awaiting."""
+
+    started_at = time.perf_counter()
+    await awaitable
+    return time.perf_counter() - started_at
+
+
+async def bench_cold_startup(args, config_dir: str) -> dict:
+    """Time a config entry setup without cache, until its locks exist."""
+
+    samples = []
+    async with running(10, args.latency, config_dir) as (hass, server):
+        for index in range(args.repeat):
+            started_at = time.perf_counter()
+            entry = await add_entry(hass, server, index)
+            samples.append(time.perf_counter() - started_at)
+
+            assert len(get_lock_ids(hass, entry)) == 10
+            await hass.config_entries.async_unload(entry.entry_id)
+
+    return summarize(samples)
+
+
+async def bench_unlock(args, config_dir: str, expire_token: bool) -> dict:
+    """Time unlock service calls, each for another door.
+
+    Equal commands for the same door within the coalescing window would be
+    joined, so every unlock is for a door which was not unlocked before.
+    """
+
+    samples = []
+    async with running(args.repeat, args.latency, config_dir) as (hass, server):
+        entry = await add_entry(hass, server)
+
+        for entity_id in get_lock_ids(hass, entry):
+            if expire_token:
+                server.expire_tokens()
+
+            samples.append(
+                await timed(
+                    hass.services.async_call(
+                        "lock", "unlock", {"entity_id": entity_id}, blocking=True
+                    )
+                )
+            )
+
+    return summarize(samples)
+
+
+async def bench_refresh(args, config_dir: str, doors: int) -> dict:
+    """Time coordinator refreshes, with the door list re-fetched every time."""
+
+    samples = []
+    async with running(doors, args.latency, config_dir) as (hass, server):
+        entry = await add_entry(hass, server)
+        coordinator = entry.coordinator
+
+        for _ in range(args.repeat):
+            samples.append(await timed(coordinator.async_refresh()))
+            assert coordinator.last_update_success
+
+    return summarize(samples)
+
+
+async def bench_memory(args, config_dir: str) -> dict:
+    """Measure the memory kept by each config entry, with 10 doors each."""
+
+    accounts = args.accounts
+    async with running(10, Latency(), config_dir) as (hass, server):
+        # Load the integration and its platforms first
+        await add_entry(hass, server, -1)
+
+        gc.collect()
+        tracemalloc.start()
+        baseline, _ = tracemalloc.get_traced_memory()
+
+        for index in range(accounts):
+            await add_entry(hass, server, index)
+
+        gc.collect()
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return {
+        "accounts": accounts,
+        "total_bytes": size - baseline,
+        "bytes_per_account": round((size - baseline) / accounts),
+    }
+
+
+def get_commit() -> str | None:
+    """Get the current commit of the repository."""
+
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, baseline: dict) -> dict[str, float]:
+    """Get the ratio of the medians, or memory, to the baseline results."""
+
+    ratios = {}
+    for case, result in results.items():
+        previous = baseline.get("results", {}).get(case)
+        if not previous:
+            continue
+
+        key = "bytes_per_account" if "bytes_per_account" in result else "p50"
+        if previous.get(key):
+            ratios[case] = round(result[key] / previous[key], 3)
+
+    return ratios
+
+
+async def run(args) -> dict:
+    """Run the selected cases."""
+
+    cases: dict[str, Callable[[str], Awaitable[dict]]] = {
+        "cold_startup": lambda config_dir: bench_cold_startup(args, config_dir),
+        "unlock_warm_token": lambda config_dir: bench_unlock(args, config_dir, False),
+        "unlock_token_expired": lambda config_dir: bench_unlock(args, config_dir, True),
+        **{
+            f"refresh_{doors}_doors": (
+                lambda config_dir, doors=doors: bench_refresh(args, config_dir, doors)
+            )
+            for doors in REFRESH_DOORS
+        },
+        "memory_per_account": lambda config_dir: bench_memory(args, config_dir),
+    }
+
+    results = {}
+    for name, case in cases.items():
+        if args.case and name not in args.case:
+            continue
+
+        # A new config dir for every case, so no cache is shared
+        with tempfile.TemporaryDirectory() as config_dir:
+            results[name] = await case(config_dir)
+
+        print(f"{name}: {results[name]}", file=sys.stderr)
+
+    return results
+
+
+def main() -> None:
+    """Run the benchmarks."""
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--accounts", type=int, default=20)
+    parser.add_argument(
+        "--latency",
+        type=Latency.parse,
+        default=Latency.parse("fixed:0.01"),
+        help="latency of the mock servers, see mock_server.py",
+    )
+    parser.add_argument("--case", action="append", help="only run these cases")
+    parser.add_argument("--output", type=Path, help="also write the results here")
+    parser.add_argument("--compare", type=Path, help="previous results to compare")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+
+    document = {
+        "meta": {
+            "commit": get_commit(),
+            "python": platform.python_version(),
+            "homeassistant": HA_VERSION,
+            "repeat": args.repeat,
+            "latency": f"{args.latency.kind}:{','.join(map(str, args.latency.params))}",
+        },
+        "results": results,
+    }
+    if args.compare:
+        document["ratio_to_baseline"] = compare(
+            results, json.loads(args.compare.read_text())
+        )
+
+    output = json.dumps(document, indent=2)
+    if args.output:
+        args.output.write_text(output + "\n")
+
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
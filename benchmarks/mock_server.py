@@ -0,0 +1,408 @@
+"""A local stand-in for the XiaoTu servers, for load and latency tests.
+
+Usage: python benchmarks/mock_server.py [--port 8080] [--villages 1] [--doors 10]
+    [--latency lognormal:0.08,0.5] [--endpoint-latency openDoorNew=fixed:0.3]
+    [--error-rate 429=0.05] [--token-ttl 3600] [--seed 1]
+
+Implements `loginByOpenId`, `getUserInfoV2`, `getDoor` and `openDoorNew`
+with the `code`/`desc`/`result` envelope of the real servers. Use the printed
+URL as the API host of the integration.
+
+Latency distributions are `none`, `fixed:<s>`, `uniform:<min>,<max>` and
+`lognormal:<median>,<sigma>`. Injected errors are `301` (token expired),
+`429` (quota, with `Retry-After`), `500` and `timeout` (no response for
+`--timeout-delay` seconds).
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import base64
+from collections import Counter
+from dataclasses import dataclass, field
+import math
+import random
+import time
+from uuid import uuid4
+from zlib import crc32
+
+from aiohttp import web
+
+LOGIN_PATH = "/userClient/clientV2/loginByOpenId"
+USER_INFO_PATH = "/userClient/cuserV2/getUserInfoV2"
+DOORS_PATH = "/wap/door/getDoor"
+OPEN_DOOR_PATH = "/wap/door/openDoorNew"
+
+# Short endpoint names, as used on the command line
+ENDPOINTS = {
+    "loginByOpenId": LOGIN_PATH,
+    "getUserInfoV2": USER_INFO_PATH,
+    "getDoor": DOORS_PATH,
+    "openDoorNew": OPEN_DOOR_PATH,
+}
+
+ERROR_KINDS = ("301", "429", "500", "timeout")
+
+
+@dataclass(frozen=True)
+class Latency:
+    """A latency distribution, in seconds."""
+
+    kind: str = "none"
+    params: tuple[float, ...] = ()
+
+    @classmethod
+    def parse(cls, value: str) -> Latency:
+        """Parse `kind:param,param`, e.g. `lognormal:0.08,0.5`."""
+
+        kind, _, params = value.partition(":")
+        latency = cls(kind, tuple(float(param) for param in params.split(",") if param))
+
+        expected = {"none": 0, "fixed": 1, "uniform": 2, "lognormal": 2}
+        if expected.get(kind) != len(latency.params):
+            raise ValueError(f"Invalid latency: {value}")
+
+        return latency
+
+    def sample(self, rng: random.Random) -> float:
+        """Draw a latency."""
+
+        if self.kind == "fixed":
+            return self.params[0]
+        if self.kind == "uniform":
+            return rng.uniform(*self.params)
+        if self.kind == "lognormal":
+            median, sigma = self.params
+            return rng.lognormvariate(math.log(median), sigma)
+
+        return 0.0
+
+
+@dataclass
+class MockConfig:
+    """Settings of the mock servers."""
+
+    villages: int = 1
+    # Doors per village
+    doors: int = 10
+    latency: Latency = field(default_factory=Latency)
+    # Latency by endpoint path, overriding `latency`
+    endpoint_latency: dict[str, Latency] = field(default_factory=dict)
+    # Probability of each kind of error, for every request
+    error_rates: dict[str, float] = field(default_factory=dict)
+    retry_after: int = 1
+    timeout_delay: float = 60.0
+    # Seconds a token is valid, forever if unset
+    token_ttl: float | None = None
+    # Seconds an opened door is reported open by getDoor
+    open_duration: float = 5.0
+    seed: int | None = None
+
+
+def make_door(village: int, index: int) -> dict:
+    """Build a door record, shaped like a `getDoor` result item."""
+
+    door_id = f"{village:04d}{index:08d}"
+    return {
+        "id": f"D{door_id}",
+        "doorId": door_id,
+        "name": f"Building {index // 20} Gate {index % 20}",
+        "type": "1",
+        "doorType": "door",
+        "status": "0",
+        "isOpen": "2",
+        "villageId": f"V{village:04d}",
+        "deviceSn": f"SN{door_id}",
+        "imageItem": {
+            "originalImage": f"https://img.example.com/door/{door_id}.jpg",
+            "thumbnailImage": f"https://img.example.com/door/{door_id}_s.jpg",
+        },
+    }
+
+
+def envelope(result=None, code: int = 200, desc: str = "success") -> web.Response:
+    """Build an API response, the code is a string like on the real servers."""
+    return web.json_response({"code": str(code), "desc": desc, "result": result})
+
+
+class MockXiaoTuServer:
+    """The mock servers, to run in the event loop of a benchmark or alone."""
+
+    def __init__(self, config: MockConfig | None = None) -> None:
+        """Initialize the servers."""
+
+        self.config = config or MockConfig()
+        self.rng = random.Random(self.config.seed)
+
+        self.villages = [
+            [make_door(village, index) for index in range(self.config.doors)]
+            for village in range(self.config.villages)
+        ]
+        # Door id -> time the door was opened
+        self.opened_at: dict[str, float] = {}
+        # Token -> (openid, time issued)
+        self.tokens: dict[str, tuple[str, float]] = {}
+
+        # Requests and injected errors by endpoint path
+        self.requests: Counter[str] = Counter()
+        self.errors: Counter[str] = Counter()
+
+        self.app = web.Application()
+        self.app.router.add_post(LOGIN_PATH, self.handle_login)
+        self.app.router.add_post(USER_INFO_PATH, self.handle_user_info)
+        self.app.router.add_get(DOORS_PATH, self.handle_doors)
+        self.app.router.add_get(OPEN_DOOR_PATH, self.handle_open_door)
+        self.app.router.add_route("*", "/", self.handle_root)
+
+        self._runner: web.AppRunner | None = None
+        self.url = ""
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Start serving, returns the base URL."""
+
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+
+        port = self._runner.addresses[0][1]
+        self.url = f"http://{host}:{port}"
+        return self.url
+
+    async def stop(self) -> None:
+        """Stop serving."""
+
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def expire_tokens(self) -> None:
+        """Expire all issued tokens, the next requests get code 301."""
+        self.tokens.clear()
+
+    def get_village(self, openid: str) -> int:
+        """Get the village of a user, stable for an openid."""
+        return crc32(openid.encode()) % self.config.villages
+
+    async def _begin(self, request: web.Request) -> web.Response | None:
+        """Count a request, wait for its latency, and inject an error.
+
+        Returns the error response, if any.
+        """
+
+        path = request.path
+        self.requests[path] += 1
+
+        latency = self.config.endpoint_latency.get(path, self.config.latency)
+        if delay := latency.sample(self.rng):
+            await asyncio.sleep(delay)
+
+        for kind in ERROR_KINDS:
+            rate = self.config.error_rates.get(kind, 0.0)
+            if kind == "301" and path == LOGIN_PATH:
+                continue
+            if rate and self.rng.random() < rate:
+                self.errors[f"{path} {kind}"] += 1
+                return await self._error(kind)
+
+        return None
+
+    async def _error(self, kind: str) -> web.Response:
+        """Build an injected error."""
+
+        if kind == "301":
+            return envelope(code=301, desc="token expired")
+        if kind == "429":
+            return web.Response(
+                status=429,
+                text="quota exceeded",
+                headers={"Retry-After": str(self.config.retry_after)},
+            )
+        if kind == "timeout":
+            await asyncio.sleep(self.config.timeout_delay)
+
+        return web.Response(status=500, text="internal error")
+
+    async def _get_openid(self, request: web.Request) -> str | None:
+        """Get the user of the token of a request, None if it is not valid."""
+
+        token = request.headers.get("tokenId") or request.query.get("tokenId")
+        if not token and request.method == "POST":
+            token = (await request.post()).get("tokenId")
+
+        issued = self.tokens.get(token or "")
+        if not issued:
+            return None
+
+        openid, issued_at = issued
+        ttl = self.config.token_ttl
+        if ttl is not None and time.monotonic() - issued_at > ttl:
+            del self.tokens[token]
+            return None
+
+        return openid
+
+    async def handle_root(self, request: web.Request) -> web.Response:
+        """Answer the connection warm up."""
+        return web.Response(text="ok")
+
+    async def handle_login(self, request: web.Request) -> web.Response:
+        """Issue a token for an openid."""
+
+        if (error := await self._begin(request)) is not None:
+            return error
+
+        form = await request.post()
+        openid = form.get("openid")
+        if not openid:
+            return envelope(code=500, desc="openid required")
+
+        token = uuid4().hex
+        self.tokens[token] = (openid, time.monotonic())
+
+        return envelope({"tokenId": token})
+
+    async def handle_user_info(self, request: web.Request) -> web.Response:
+        """Return the user info and village of the token."""
+
+        if (error := await self._begin(request)) is not None:
+            return error
+        if not (openid := await self._get_openid(request)):
+            return envelope(code=301, desc="token expired")
+
+        village = self.get_village(openid)
+        user_id = f"U{crc32(openid.encode()):010d}"
+
+        return envelope(
+            {
+                "userId": user_id,
+                "name": f"User {user_id}",
+                "mobile": base64.b64encode(b"13800000000").decode(),
+                "villageId": f"V{village:04d}",
+                "villageName": f"Village {village}",
+                "building": "1",
+                "houseId": f"H{user_id}",
+            }
+        )
+
+    async def handle_doors(self, request: web.Request) -> web.Response:
+        """Return the doors of the village of the token."""
+
+        if (error := await self._begin(request)) is not None:
+            return error
+        if not (openid := await self._get_openid(request)):
+            return envelope(code=301, desc="token expired")
+
+        now = time.monotonic()
+        doors = []
+        for door in self.villages[self.get_village(openid)]:
+            opened_at = self.opened_at.get(door["doorId"])
+            if opened_at and now - opened_at < self.config.open_duration:
+                door = {**door, "isOpen": "1"}
+            doors.append(door)
+
+        return envelope(doors)
+
+    async def handle_open_door(self, request: web.Request) -> web.Response:
+        """Open a door of the village of the token."""
+
+        if (error := await self._begin(request)) is not None:
+            return error
+        if not (openid := await self._get_openid(request)):
+            return envelope(code=301, desc="token expired")
+
+        door_id = request.query.get("doorId", "")
+        village = self.villages[self.get_village(openid)]
+        if not any(door["doorId"] == door_id for door in village):
+            return envelope(code=404, desc="door not found")
+
+        self.opened_at[door_id] = time.monotonic()
+
+        return envelope()
+
+
+def parse_args(args: list[str] | None = None) -> tuple[argparse.Namespace, MockConfig]:
+    """Parse the command line into the settings of the servers."""
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--villages", type=int, default=1)
+    parser.add_argument("--doors", type=int, default=10, help="doors per village")
+    parser.add_argument("--latency", type=Latency.parse, default=Latency())
+    parser.add_argument(
+        "--endpoint-latency",
+        action="append",
+        default=[],
+        metavar="NAME=DIST",
+        help=f"latency of one endpoint, one of {', '.join(ENDPOINTS)}",
+    )
+    parser.add_argument(
+        "--error-rate",
+        action="append",
+        default=[],
+        metavar="KIND=RATE",
+        help=f"probability of an error, one of {', '.join(ERROR_KINDS)}",
+    )
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--timeout-delay", type=float, default=60.0)
+    parser.add_argument("--token-ttl", type=float, default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    options = parser.parse_args(args)
+
+    endpoint_latency = {}
+    for value in options.endpoint_latency:
+        name, _, dist = value.partition("=")
+        endpoint_latency[ENDPOINTS[name]] = Latency.parse(dist)
+
+    error_rates = {}
+    for value in options.error_rate:
+        kind, _, rate = value.partition("=")
+        if kind not in ERROR_KINDS:
+            parser.error(f"unknown error kind: {kind}")
+        error_rates[kind] = float(rate)
+
+    config = MockConfig(
+        villages=options.villages,
+        doors=options.doors,
+        latency=options.latency,
+        endpoint_latency=endpoint_latency,
+        error_rates=error_rates,
+        retry_after=options.retry_after,
+        timeout_delay=options.timeout_delay,
+        token_ttl=options.token_ttl,
+        seed=options.seed,
+    )
+
+    return options, config
+
+
+async def serve(host: str, port: int, config: MockConfig) -> None:
+    """Serve until interrupted."""
+
+    server = MockXiaoTuServer(config)
+    url = await server.start(host, port)
+    print(f"Mock XiaoTu servers at {url}", flush=True)
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+        print(f"Requests: {dict(server.requests)}")
+        print(f"Injected errors: {dict(server.errors)}")
+
+
+def main() -> None:
+    """Run the servers."""
+
+    options, config = parse_args()
+
+    try:
+        asyncio.run(serve(options.host, options.port, config))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -2,17 +2,21 @@
 
 from __future__ import annotations
 
+import asyncio
 import logging
 
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.const import Platform
 from homeassistant.core import HomeAssistant
+from homeassistant.exceptions import ConfigEntryNotReady
 from homeassistant.helpers import device_registry as dr
 
-from .const import DOMAIN
+from .const import DOMAIN, SETUP_TIMEOUT, STARTUP_SPREAD
 from .coordinator import XiaoTuCoordinator
+from .entity import get_account_device_id
+from .store import XiaoTuStore
 
-PLATFORMS: list[Platform] = [Platform.LOCK]
+PLATFORMS: list[Platform] = [Platform.LOCK, Platform.SENSOR]
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -24,15 +28,41 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
 
     # Set up one data coordinator per account/config entry
     coordinator = XiaoTuCoordinator(hass, entry)
-    await coordinator.async_config_entry_first_refresh()
+    if await coordinator.async_restore():
+        # Set up from the cache at once and revalidate it in the background,
+        # stale data keeps the entities unavailable until the servers answer
+        delay = 0.0
+        if coordinator.cache_fresh:
+            coordinator.async_set_updated_data(None)
+
+            # Spread the revalidation of many entries after a restart
+            delay = coordinator.scheduler.get_offset(
+                entry.entry_id, STARTUP_SPREAD
+            ).total_seconds()
+
+        entry.async_create_background_task(
+            hass, coordinator.async_revalidate(delay), f"{DOMAIN}.revalidate"
+        )
+    else:
+        try:
+            async with asyncio.timeout(SETUP_TIMEOUT.total_seconds()):
+                await coordinator.async_config_entry_first_refresh()
+        except TimeoutError as err:
+            raise ConfigEntryNotReady(
+                f"Timeout after {SETUP_TIMEOUT.total_seconds()}s"
+            ) from err
 
     entry.coordinator = coordinator
 
     # Set up all platforms except notify
     await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
 
+    coordinator.async_setup_presence()
+    entry.async_on_unload(entry.add_update_listener(async_update_options))
+
     # Clean up devices which are not assigned to the account anymore
     account_devices = {(DOMAIN, v.id) for v in coordinator.account.devices}
+    account_devices.add((DOMAIN, get_account_device_id(entry)))
     device_registry = dr.async_get(hass)
     device_entries = dr.async_entries_for_config_entry(
         device_registry, config_entry_id=entry.entry_id
@@ -46,7 +76,20 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     return True
 
 
+async def async_update_options(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Reload the config entry when the options change."""
+
+    await hass.config_entries.async_reload(entry.entry_id)
+
+
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Unload a config entry."""
 
+    # The coordinator is shut down by the entry, see DataUpdateCoordinator
     return await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
+
+
+async def async_remove_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Remove the cached data of a config entry."""
+
+    await XiaoTuStore(hass, entry.entry_id).async_remove()
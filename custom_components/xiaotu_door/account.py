@@ -1,16 +1,23 @@
 """Access to a XiaoTu account."""
 
+import asyncio
 from base64 import b64decode
-from dataclasses import dataclass, field
+from collections.abc import Awaitable
+from dataclasses import asdict, dataclass, field
 
 # import json
 import logging
+import time
+from typing import Any, TypeVar
 
 from .api import API, APIConfiguration
 from .dao import XiaoTuDevice
+from .utils import get_envelope, get_now
 
 _LOGGER = logging.getLogger(__name__)
 
+_T = TypeVar("_T")
+
 
 @dataclass
 class XiaoTuUser:
@@ -36,7 +43,7 @@ class XiaoTuAccount:
 
     devices: list[XiaoTuDevice] = field(default_factory=list, init=False)
 
-    def __init__(self, config: dict) -> None:
+    def __init__(self, config: dict, limiter: asyncio.Semaphore | None = None) -> None:
         """Initialize the account."""
 
         # Only for debugging
@@ -45,32 +52,42 @@ class XiaoTuAccount:
         api_config = APIConfiguration(**config)
 
         self.api_config = api_config
-        self.api = API(self.api_config)
+        self.api = API(self.api_config, limiter=limiter)
         self.user = XiaoTuUser()
 
         self.devices = []
         self.devices_info_map = {}
 
+        # Lookup index of `self.devices`, by case folded id
+        self._devices_by_id: dict[str, XiaoTuDevice] = {}
+
         self.fetched_at = None
 
+        # Duration of each phase of the last `bootstrap`, in seconds
+        self.bootstrap_timings: dict[str, float] = {}
+
     async def get_user(self, force_init: bool = False) -> XiaoTuUser:
         """Get the user info."""
 
         user = self.user
         if not user.userId or force_init:
-            auth = await self.api.get_auth()
-
+            # The token is added by `XiaoTuAuth`
             res = await self.api.post(
-                "/userClient/cuserV2/getUserInfoV2", data=auth.toJSON(auth)
+                "/userClient/cuserV2/getUserInfoV2", data=self.api.auth.toJSON()
             )
-            ret = res.json()["result"]
+            ret = get_envelope(res).result
 
             for key in ret:
                 if hasattr(user, key):
                     setattr(user, key, ret[key])
 
-            # Decode mobile
-            user.mobile = b64decode(user.mobile).decode()
+            # Decode mobile, kept as is if not encoded (e.g. anonymized)
+            try:
+                user.mobile = b64decode(user.mobile).decode()
+            except (ValueError, UnicodeDecodeError):
+                pass
+
+            user.fetched_at = get_now()
 
         # Get village info
         # Only support 1 village/house now
@@ -78,19 +95,104 @@ class XiaoTuAccount:
 
         return user
 
+    async def get_doors(self) -> list[dict]:
+        """Get the raw door list of the user."""
+
+        # The token is added by `XiaoTuAuth`, the endpoint expects it as param
+        res = await self.api.get("/wap/door/getDoor", params={"tokenId": ""})
+
+        return get_envelope(res).result
+
     async def get_devices(self, force_init: bool = False) -> list[XiaoTuDevice]:
         """Retrieve device data from servers."""
 
-        # Only support 1 village/house
         if len(self.devices) == 0 or force_init:
             user = await self.get_user(force_init=force_init)
+            self._add_user_devices(user)
 
-            self.add_device(
-                {"type": "village", "id": user.villageId, "name": user.villageName}
-            )
+        return self.devices
+
+    def _add_user_devices(self, user: XiaoTuUser) -> None:
+        """Add the devices of the user."""
+
+        # Only support 1 village/house
+        self.add_device(
+            {"type": "village", "id": user.villageId, "name": user.villageName}
+        )
+
+    async def bootstrap(
+        self, force_init: bool = False, sync_entities: bool = False
+    ) -> list[XiaoTuDevice]:
+        """Retrieve user info, devices and their entities.
+
+        Independent requests run concurrently: after the login, the user info
+        and the door list are fetched together, and all devices load their
+        entities in parallel.
+        :param sync_entities: Re-fetch the door list even if it is loaded.
+        """
+
+        timings: dict[str, float] = {}
+        started_at = time.monotonic()
+
+        async def timed(phase: str, awaitable: Awaitable[_T]) -> _T:
+            phase_started_at = time.monotonic()
+            try:
+                return await awaitable
+            finally:
+                timings[phase] = round(time.monotonic() - phase_started_at, 3)
+
+        await timed("auth", self.api.get_auth())
+
+        # The door list only needs the token, not the user info
+        need_doors = (
+            force_init
+            or sync_entities
+            or not self.devices
+            or any(device.fetched_at is None for device in self.devices)
+        )
+        tasks: list[Awaitable[Any]] = [
+            timed("user", self.get_user(force_init=force_init))
+        ]
+        if need_doors:
+            tasks.append(timed("doors", self.get_doors()))
+
+        user, *fetched = await asyncio.gather(*tasks)
+        doors = fetched[0] if fetched else None
+
+        if not self.devices or force_init:
+            self._add_user_devices(user)
+
+        await timed(
+            "entities",
+            asyncio.gather(
+                *(
+                    device.get_entities(force_init=force_init, doors=doors)
+                    for device in self.devices
+                )
+            ),
+        )
+
+        timings["total"] = round(time.monotonic() - started_at, 3)
+        self.bootstrap_timings = timings
+
+        _LOGGER.debug("XiaoTuAccount.bootstrap: %s", timings)
 
         return self.devices
 
+    def restore_user(self, data: dict) -> XiaoTuUser:
+        """Restore the user info from a previous session."""
+
+        user = self.user
+        for key in data:
+            if hasattr(user, key):
+                setattr(user, key, data[key])
+
+        return user
+
+    def dump_user(self) -> dict:
+        """Get the user info as a serializable dict."""
+        return asdict(self.user)
+
     def add_device(self, data: dict) -> XiaoTuDevice:
         """Add a device."""
 
@@ -103,9 +205,10 @@ class XiaoTuAccount:
             device = XiaoTuDevice(account=self, base_data=data)
 
             self.devices.append(device)
+            self._devices_by_id[device.id.casefold()] = device
 
         return device
 
     def get_device(self, id: str) -> XiaoTuDevice | None:
         """Get device with given id."""
-        return next((device for device in self.devices if device.id == id), None)
+        return self._devices_by_id.get(id.casefold())
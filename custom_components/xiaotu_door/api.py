@@ -2,29 +2,54 @@
 
 import asyncio
 from collections import defaultdict
-from dataclasses import dataclass
+from collections.abc import AsyncGenerator
+from dataclasses import dataclass, field
 import datetime
 from hashlib import md5
+from importlib.util import find_spec
 import logging
 import math
+import time
 from typing import collections
+from urllib.parse import parse_qsl, urlencode
 from uuid import uuid4
 
 import httpx
 
-from .const import AUTH_VALID_OFFSET, DEFAULT_API_HOST, HTTPX_TIMEOUT, X_USER_AGENT
+from .circuit import CircuitBreaker, CircuitBreakerTransport
+from .const import (
+    AUTH_VALID_OFFSET,
+    CAPTURE_MAX_BYTES,
+    CIRCUIT_COOLDOWN,
+    CIRCUIT_FAILURE_THRESHOLD,
+    DEFAULT_API_HOST,
+    EXPIRES_AT_OFFSET,
+    HTTPX_TIMEOUT,
+    X_USER_AGENT,
+)
+from .metrics import APIMetrics
+from .ratelimit import BUDGET_COMMAND, RateLimiter, get_policy
+from .replay import RecordingTransport, ReplayTransport
 from .utils import (
-    RESPONSE_STORE,
     APIError,
     AuthError,
-    anonymize_response,
+    QuotaError,
+    ResponseCapture,
+    get_envelope,
     get_now,
     handle_httpstatuserror,
 )
 
 from homeassistant.const import CONF_HOST
 
-EXPIRES_AT_OFFSET = datetime.timedelta(seconds=HTTPX_TIMEOUT * 2)
+# Request extension for requests whose response is not a XiaoTu API envelope
+EXTENSION_RAW = "xiaotu_raw"
+# Request extension holding the time the request was sent, for the metrics
+EXTENSION_SENT_AT = "xiaotu_sent_at"
+# Request extension for requests which `XiaoTuAuth` replays on code 301
+EXTENSION_AUTH_RETRY = "xiaotu_auth_retry"
+# Request extension holding the `asyncio.Timeout` of the attempt, see `_send_within`
+EXTENSION_DEADLINE = "xiaotu_deadline"
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -35,7 +60,7 @@ class APIAuth:
 
     client_id: str = ""
     token_id: str = ""
-    fetched_at = None
+    fetched_at: datetime.datetime | None = None
 
     @property
     def uuidString(self) -> str:
@@ -63,25 +88,255 @@ class APIConfiguration:
     username: str = ""
     password: str = ""
 
-    auth: APIAuth = APIAuth
+    auth: APIAuth = field(default_factory=APIAuth)
 
     proxy_config: dict | None = None
 
     timeout: float = HTTPX_TIMEOUT
+    # Renew the token this many seconds before it expires
+    auth_refresh_margin: float = EXPIRES_AT_OFFSET.total_seconds()
+    # Capture responses for the diagnostics, also done when debug logging
     log_responses: bool = False
 
-    def set_log_responses(self, log_responses: bool) -> None:
-        """Set if responses are logged and clear response store."""
+    # Connection pool, shared by all accounts with the same host and proxy
+    max_connections: int = 10
+    max_keepalive_connections: int = 5
+    keepalive_expiry: float = 60.0
+    http2: bool = False
+
+    # Circuit breaker, see `CircuitBreaker`
+    circuit_failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD
+    circuit_cooldown: float = CIRCUIT_COOLDOWN.total_seconds()
+
+    # Bytes of response content kept for the diagnostics
+    capture_max_bytes: int = CAPTURE_MAX_BYTES
+
+    # Save the traffic to a directory, or serve it from one without network,
+    # at the recorded latency divided by `replay_speed`, or at once if unset
+    record_dir: str | None = None
+    replay_dir: str | None = None
+    replay_speed: float | None = None
+
+
+class XiaoTuAuth(httpx.Auth):
+    """Add the token to requests, login again once when it expired.
+
+    The token is sent as `tokenId` header, and replaces the `tokenId` query
+    param and form field where the request has them, so it is not logged with
+    the URLs of other endpoints. On a 301 envelope the token is renewed
+    (shared with concurrent callers) and only the failed request is replayed.
+    """
+
+    requires_response_body = True
+
+    def __init__(self, api: "API") -> None:
+        """Initialize the auth."""
+        self.api = api
+
+    async def async_auth_flow(
+        self, request: httpx.Request
+    ) -> AsyncGenerator[httpx.Request, httpx.Response]:
+        """Execute the authentication flow."""
+
+        token_id = await self._get_token(request)
+
+        request = self._apply_token(request, token_id)
+        request.extensions[EXTENSION_AUTH_RETRY] = True
+        response = yield request
+
+        if request.extensions.get(EXTENSION_RAW) or get_envelope(response).code != 301:
+            return
+
+        _LOGGER.debug("XiaoTuAuth.retry: %s", request.url.path)
+
+        self.api.invalidate_auth(token_id)
+
+        request = self._apply_token(request, await self._get_token(request))
+        request.extensions[EXTENSION_AUTH_RETRY] = False
+        yield request
+
+    async def _get_token(self, request: httpx.Request) -> str:
+        """Get a valid token.
+
+        A login is bounded by its own timeout, so it is not counted in the
+        deadline of the request it is made for.
+        """
+
+        deadline: asyncio.Timeout | None = request.extensions.get(EXTENSION_DEADLINE)
+        if self.api.is_auth_valid() or deadline is None or deadline.when() is None:
+            return await self._fetch_token()
+
+        loop = asyncio.get_running_loop()
+        remaining = deadline.when() - loop.time()
+        deadline.reschedule(None)
+        try:
+            return await self._fetch_token()
+        finally:
+            deadline.reschedule(loop.time() + remaining)
+
+    async def _fetch_token(self) -> str:
+        """Get a valid token, login if needed."""
+
+        auth = await self.api.get_auth()
+        if not auth.token_id:
+            # Invalidated by a concurrent request while waiting for the login
+            auth = await self.api.get_auth()
+
+        return auth.token_id
+
+    @staticmethod
+    def _apply_token(request: httpx.Request, token_id: str) -> httpx.Request:
+        """Build a copy of the request with the given token."""
+
+        headers = request.headers.copy()
+        headers["tokenId"] = token_id
+
+        content = request.content
+        if content and headers.get("content-type", "").startswith(
+            "application/x-www-form-urlencoded"
+        ):
+            form = dict(parse_qsl(content.decode(), keep_blank_values=True))
+            if "tokenId" in form:
+                form["tokenId"] = token_id
+                content = urlencode(form).encode()
+                headers.pop("content-length", None)
+
+        url = request.url
+        if "tokenId" in url.params:
+            url = url.copy_set_param("tokenId", token_id)
+
+        return httpx.Request(
+            request.method,
+            url,
+            headers=headers,
+            content=content,
+            extensions=dict(request.extensions),
+        )
+
+
+class _TransportLease(httpx.AsyncBaseTransport):
+    """A reference to a shared transport, closing it releases the reference."""
+
+    def __init__(
+        self,
+        pool: "TransportPool",
+        key: tuple,
+        transport: httpx.AsyncBaseTransport,
+        limiter: asyncio.Semaphore | None = None,
+    ) -> None:
+        """Initialize the lease."""
 
-        self.log_responses = log_responses
-        RESPONSE_STORE.clear()
+        self._pool = pool
+        self._key = key
+        self._transport = transport
+        self._limiter = limiter
+        self._closed = False
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        """Send the request with the shared transport.
+
+        The limiter is only held while waiting for the response headers, so
+        a login in the auth flow never waits for the request it is made for.
+        Commands and logins are not limited, they never queue behind polls.
+        """
+        if self._limiter is None or get_policy(request).budget == BUDGET_COMMAND:
+            return await self._transport.handle_async_request(request)
+
+        async with self._limiter:
+            return await self._transport.handle_async_request(request)
+
+    async def aclose(self) -> None:
+        """Release the shared transport."""
+
+        if not self._closed:
+            self._closed = True
+            await self._pool.release(self._key)
+
+
+class TransportPool:
+    """Pooled transports, one per (host, proxy, verify) tuple.
+
+    Transports are reference counted and closed when the last API using them
+    is closed. The first API acquiring a transport decides its pool settings.
+    """
+
+    def __init__(self) -> None:
+        """Initialize the pool."""
+
+        # key -> [transport, reference count]
+        self._transports: dict[tuple, list] = {}
+
+    def acquire(
+        self, config: APIConfiguration, limiter: asyncio.Semaphore | None = None
+    ) -> _TransportLease:
+        """Get a lease on the transport matching the configuration.
+
+        Requests sent with the lease wait for `limiter`, if any.
+        """
+
+        proxy_config = config.proxy_config or {}
+        proxy_url = proxy_config.get("url")
+        verify = proxy_config.get("ca_path") or True
+
+        key = (getattr(config, CONF_HOST), proxy_url, verify)
+        entry = self._transports.get(key)
+        if entry:
+            entry[1] += 1
+        else:
+            http2 = config.http2
+            if http2 and not find_spec("h2"):
+                _LOGGER.warning("HTTP/2 disabled, the `h2` package is not installed")
+                http2 = False
+
+            transport = httpx.AsyncHTTPTransport(
+                verify=verify,
+                http2=http2,
+                limits=httpx.Limits(
+                    max_connections=config.max_connections,
+                    max_keepalive_connections=config.max_keepalive_connections,
+                    keepalive_expiry=config.keepalive_expiry,
+                ),
+                proxy=httpx.Proxy(proxy_url) if proxy_url else None,
+            )
+            entry = self._transports[key] = [transport, 1]
+
+            _LOGGER.debug("TransportPool.create: %s", key)
+
+        return _TransportLease(self, key, entry[0], limiter)
+
+    async def release(self, key: tuple) -> None:
+        """Release a reference, close the transport if it is not used anymore."""
+
+        entry = self._transports.get(key)
+        if not entry:
+            return
+
+        entry[1] -= 1
+        if entry[1] <= 0:
+            del self._transports[key]
+            await entry[0].aclose()
+
+            _LOGGER.debug("TransportPool.close: %s", key)
+
+
+# Transports shared by all API clients
+TRANSPORT_POOL = TransportPool()
 
 
 class API(httpx.AsyncClient):
     """Async HTTP API based on `httpx.AsyncClient`."""
 
-    def __init__(self, config: APIConfiguration, *args, **kwargs) -> None:
-        """Initialize the API."""
+    def __init__(
+        self,
+        config: APIConfiguration,
+        *args,
+        limiter: asyncio.Semaphore | None = None,
+        **kwargs,
+    ) -> None:
+        """Initialize the API.
+
+        `limiter` bounds the concurrent requests shared with other APIs.
+        """
 
         self.config = config
 
@@ -91,29 +346,45 @@ class API(httpx.AsyncClient):
 
         # init token
         auth = config.auth
+        auth.client_id = config.password
         init_token = config.init_token
         if init_token:
-            auth.client_id = config.password
             auth.token_id = init_token.get("token_id", "")
             auth.fetched_at = datetime.datetime.fromisoformat(
                 init_token.get("fetched_at")
             )
 
-        _LOGGER.info("API.init_auth: %s", self.auth.toJSON(auth))
+        _LOGGER.info("API.init_auth: %s", auth.toJSON())
+
+        # Share connections with other APIs, proxy config is part of the transport
+        # Replays do not use the network at all
+        if "transport" not in kwargs:
+            if config.replay_dir:
+                kwargs["transport"] = ReplayTransport(
+                    config.replay_dir, config.replay_speed
+                )
+            else:
+                kwargs["transport"] = TRANSPORT_POOL.acquire(config, limiter)
+
+        if config.record_dir:
+            kwargs["transport"] = RecordingTransport(
+                kwargs["transport"], config.record_dir
+            )
 
-        # Proxy config
-        proxy_config = config.proxy_config or {}
-        if proxy_config.get("url"):
-            kwargs["proxies"] = {
-                "http://": proxy_config.get("url"),
-                "https://": proxy_config.get("url"),
-            }
-        if proxy_config.get("ca_path"):
-            kwargs["verify"] = config.proxy_config["ca_path"]
+        # Fail fast while the servers are down
+        self.circuit_breaker = CircuitBreaker(
+            config.circuit_failure_threshold, config.circuit_cooldown
+        )
+        kwargs["transport"] = CircuitBreakerTransport(
+            kwargs["transport"], self.circuit_breaker
+        )
 
         # Increase timeout
         kwargs["timeout"] = config.timeout
 
+        # Add the token to all requests, except the ones passing `auth=None`
+        kwargs["auth"] = XiaoTuAuth(self)
+
         # Set default values
         kwargs["base_url"] = kwargs.get("base_url") or getattr(config, CONF_HOST)
         kwargs["headers"] = self.generate_header(kwargs.get("headers"), kwargs)
@@ -121,21 +392,47 @@ class API(httpx.AsyncClient):
         # Register event hooks
         kwargs["event_hooks"] = defaultdict(list, **kwargs.get("event_hooks", {}))
 
-        # Event hook for logging content
+        # Event hook for measuring the time spent opening new connections
+        async def trace_connect(request: httpx.Request):
+            request.extensions["trace"] = self._create_connect_tracer()
+
+        # Event hooks for measuring the latency of each endpoint
+        self.metrics = APIMetrics()
+
+        async def start_timer(request: httpx.Request):
+            request.extensions[EXTENSION_SENT_AT] = time.monotonic()
+
+        async def record_latency(response: httpx.Response):
+            request = response.request
+            if sent_at := request.extensions.get(EXTENSION_SENT_AT):
+                self.metrics.record_latency(
+                    request.url.path, time.monotonic() - sent_at
+                )
+
+        # Event hook capturing the responses for the diagnostics
+        self.responses = ResponseCapture(config.capture_max_bytes)
+
         async def log_response(response: httpx.Response):
-            await response.aread()
-            RESPONSE_STORE.append(anonymize_response(response))
+            if self.config.log_responses or _LOGGER.isEnabledFor(logging.DEBUG):
+                await response.aread()
+                self.responses.append(response)
 
-        if config.log_responses:
-            kwargs["event_hooks"]["response"].append(log_response)
+        kwargs["event_hooks"]["request"].append(trace_connect)
+        kwargs["event_hooks"]["request"].append(start_timer)
+        kwargs["event_hooks"]["response"].append(record_latency)
+        kwargs["event_hooks"]["response"].append(log_response)
 
         # Event hook which calls raise_for_status on all requests
         async def raise_for_status_event_handler(response: httpx.Response):
             """Event handler that automatically raises HTTPStatusErrors when attached.
 
-            Will only raise on 4xx/5xx errors but not 401/429 which are handled `self.auth`.
+            Will only raise on 4xx/5xx errors but not 401 which is handled `self.auth`,
+            429 raises a `QuotaError` which is retried by `self.send`.
             """
-            if response.is_error and response.status_code not in [401, 429]:
+            if response.request.extensions.get(EXTENSION_RAW):
+                return
+
+            if response.is_error and response.status_code != 401:
                 try:
                     response.raise_for_status()
                 except httpx.HTTPStatusError as ex:
@@ -143,25 +440,105 @@ class API(httpx.AsyncClient):
 
             # XiaoTu API
             await response.aread()
-            json_data = response.json()
-            json_code = int(json_data["code"]) or 200
-            if json_code != 200:
-                if json_code == 301:
+            envelope = get_envelope(response)
+            if envelope.code != 200:
+                if envelope.code == 301 and response.request.extensions.get(
+                    EXTENSION_AUTH_RETRY
+                ):
+                    # `XiaoTuAuth` renews the token and replays the request
+                    return
+
+                if envelope.code == 301:
                     # Reset token_id on Unauthorized
-                    config.auth.token_id = ""
+                    self.invalidate_auth(
+                        response.request.headers.get("tokenId")
+                        or response.request.url.params.get("tokenId")
+                    )
 
                     raise AuthError(
                         response=response, request=None, message="Unauthorized"
                     )
                 else:
                     raise APIError(
-                        response=response, request=None, message=json_data["desc"]
+                        response=response, request=None, message=envelope.desc
                     )
 
         kwargs["event_hooks"]["response"].append(raise_for_status_event_handler)
 
         super().__init__(*args, **kwargs)
 
+        # Request budgets and retries, see `send`
+        self.rate_limiter = RateLimiter()
+
+        # In-flight login shared by all concurrent `get_auth` callers
+        self._auth_task: asyncio.Task[APIAuth] | None = None
+
+        # Seconds spent on TCP connect and TLS handshake of the last new connection
+        self.last_connect_time: float | None = None
+        self.connect_count = 0
+
+    async def send(self, request: httpx.Request, **kwargs) -> httpx.Response:
+        """Send a request within its budget, retry it according to its policy."""
+
+        if request.extensions.get(EXTENSION_RAW):
+            return await super().send(request, **kwargs)
+
+        policy = get_policy(request)
+        timeout = policy.timeout or self.config.timeout
+
+        # Timeouts of the endpoint, unless given for the request
+        if request.extensions.get("timeout") == self.timeout.as_dict():
+            request.extensions["timeout"] = httpx.Timeout(
+                timeout, connect=min(policy.connect_timeout, timeout)
+            ).as_dict()
+
+        attempt = 0
+        while True:
+            attempt += 1
+            await self.rate_limiter.acquire(policy)
+
+            try:
+                return await self._send_within(request, timeout, **kwargs)
+            except (QuotaError, httpx.RequestError) as err:
+                delay = self.rate_limiter.get_retry_delay(policy, attempt, err)
+                if delay is None:
+                    raise
+
+                _LOGGER.debug(
+                    "API.retry: %s in %.1fs, %r", request.url.path, delay, err
+                )
+                await asyncio.sleep(delay)
+
+    async def _send_within(
+        self, request: httpx.Request, timeout: float, **kwargs
+    ) -> httpx.Response:
+        """Send a request, fail if there is no response within `timeout` seconds.
+
+        The timeouts of httpx apply to each read, this is the overall deadline.
+        A login of `XiaoTuAuth` for the request pauses it.
+        """
+
+        path = request.url.path
+
+        try:
+            async with asyncio.timeout(timeout) as deadline:
+                request.extensions[EXTENSION_DEADLINE] = deadline
+                try:
+                    response = await super().send(request, **kwargs)
+                finally:
+                    del request.extensions[EXTENSION_DEADLINE]
+        except TimeoutError as err:
+            self.metrics.record_request(path, err)
+            raise httpx.TimeoutException(
+                f"No response within {timeout}s", request=request
+            ) from err
+        except Exception as err:
+            self.metrics.record_request(path, err)
+            raise
+
+        self.metrics.record_request(path)
+        return response
+
     def generate_header(self, data: dict | None, all_data: dict) -> dict[str, str]:
         """Generate a header for HTTP requests to the server."""
 
@@ -176,29 +553,158 @@ class API(httpx.AsyncClient):
 
         return headers
 
-    async def get_auth(self) -> None:
-        """Get the authentication data."""
+    def _create_connect_tracer(self):
+        """Create a httpcore trace callback which measures new connections."""
+
+        connect_started_at: float | None = None
+
+        async def trace(event_name: str, info: dict) -> None:
+            nonlocal connect_started_at
+
+            if event_name == "connection.connect_tcp.started":
+                connect_started_at = time.monotonic()
+            elif connect_started_at and event_name in (
+                "connection.connect_tcp.complete",
+                "connection.start_tls.complete",
+            ):
+                # start_tls completes after connect_tcp and overrides it
+                self.last_connect_time = time.monotonic() - connect_started_at
+                if event_name == "connection.connect_tcp.complete":
+                    self.connect_count += 1
+
+        return trace
+
+    async def warm_up(self) -> float:
+        """Open a connection to the host, or keep an idle one alive.
+
+        Returns the seconds spent connecting, 0 if a connection was reused.
+        """
+
+        connect_count = self.connect_count
+        await self.head("/", auth=None, extensions={EXTENSION_RAW: True})
+
+        if self.connect_count == connect_count:
+            return 0.0
+
+        return self.last_connect_time or 0.0
+
+    def is_auth_valid(self) -> bool:
+        """Check if the current token can still be used."""
 
         auth = self.auth
 
-        if (
-            not auth.token_id
-            or not auth.fetched_at
-            or auth.fetched_at + AUTH_VALID_OFFSET < get_now()
-        ):
-            # Update auth
-            auth.client_id = self.config.password
+        return bool(
+            auth.token_id
+            and auth.fetched_at
+            and auth.fetched_at + AUTH_VALID_OFFSET >= get_now()
+        )
+
+    @property
+    def auth_refresh_at(self) -> datetime.datetime | None:
+        """Get the time the token should be renewed in the background."""
+
+        auth = self.auth
+        if not auth.token_id or not auth.fetched_at:
+            return None
+
+        return (
+            auth.fetched_at
+            + AUTH_VALID_OFFSET
+            - datetime.timedelta(seconds=self.config.auth_refresh_margin)
+        )
+
+    def restore_auth(self, token_id: str, fetched_at: datetime.datetime) -> None:
+        """Restore a previously fetched token."""
+
+        auth = self.auth
+        auth.client_id = self.config.password
+        auth.token_id = token_id
+        auth.fetched_at = fetched_at
+
+    def invalidate_auth(self, token_id: str | None = None) -> None:
+        """Invalidate the current token.
+
+        When `token_id` is given, the token is only reset if it is still the
+        current one, so concurrent 301 responses for the same stale token do
+        not throw away a token which was fetched in the meantime.
+        """
+
+        auth = self.auth
+        if token_id and token_id != auth.token_id:
+            return
+
+        auth.token_id = ""
+
+    async def get_auth(self) -> APIAuth:
+        """Get the authentication data.
+
+        Concurrent callers share a single in-flight login.
+        """
+
+        if self.is_auth_valid():
+            return self.auth
+
+        return await self.refresh_auth()
+
+    async def refresh_auth(self) -> APIAuth:
+        """Login again, even if the current token is still valid.
+
+        Concurrent callers share a single in-flight login. The current token
+        stays usable until the new one arrives, so callers of `get_auth` are
+        not blocked by a background renewal.
+        """
+
+        if self._auth_task is None:
+            self._auth_task = asyncio.create_task(self._login())
+            self._auth_task.add_done_callback(self._clear_auth_task)
+
+        # Shield the login so a cancelled caller does not abort it for the others
+        return await asyncio.shield(self._auth_task)
+
+    def set_log_responses(self, log_responses: bool) -> None:
+        """Set if responses are captured and drop the captured ones."""
+
+        self.config.log_responses = log_responses
+        self.responses.clear()
+
+    async def aclose(self) -> None:
+        """Abort a login in progress and close the client."""
+
+        if self._auth_task is not None:
+            self._auth_task.cancel()
+
+        await super().aclose()
+
+    def _clear_auth_task(self, task: asyncio.Task) -> None:
+        """Forget the finished login task."""
+
+        if self._auth_task is task:
+            self._auth_task = None
+
+        # Mark exceptions as retrieved if no caller is waiting anymore
+        if not task.cancelled():
+            task.exception()
+
+    async def _login(self) -> APIAuth:
+        """Login and update the authentication data."""
+
+        auth = self.auth
+        auth.client_id = self.config.password
+
+        data = {
+            **auth.toJSON(),
+            "openid": self.config.username,
+        }
 
-            data = {
-                **auth.toJSON(auth),
-                "openid": self.config.username,
-            }
+        _LOGGER.debug("API.login: %s", self.config.username)
 
-            res = await self.post("/userClient/clientV2/loginByOpenId", data=data)
+        res = await self.post(
+            "/userClient/clientV2/loginByOpenId", data=data, auth=None
+        )
 
-            ret = res.json()["result"]
-            auth.token_id = ret.get("tokenId", ret.get("access_token", ""))
-            auth.fetched_at = get_now()
+        ret = get_envelope(res).result
+        auth.token_id = ret.get("tokenId", ret.get("access_token", ""))
+        auth.fetched_at = get_now()
 
         return auth
 
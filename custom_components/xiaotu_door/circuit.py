@@ -0,0 +1,144 @@
+"""Circuit breaker for the requests to the XiaoTu servers."""
+
+from __future__ import annotations
+
+from collections.abc import Callable
+import logging
+import time
+
+import httpx
+
+from .utils import CircuitOpenError
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """Fail fast while the servers are down.
+
+    The circuit opens after `failure_threshold` consecutive failures. After
+    `cooldown` seconds it is half-open: a single probe request is let
+    through, and closes the circuit on success or opens it again on failure.
+    """
+
+    def __init__(self, failure_threshold: int, cooldown: float) -> None:
+        """Initialize the breaker, closed."""
+
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+
+        self._state = STATE_CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._listeners: list[Callable[[str], None]] = []
+
+    @property
+    def state(self) -> str:
+        """Get the state, an open circuit is half-open after the cooldown."""
+
+        if self._state == STATE_OPEN and self.retry_in <= 0:
+            return STATE_HALF_OPEN
+
+        return self._state
+
+    @property
+    def retry_in(self) -> float:
+        """Get the seconds until an open circuit lets a probe through."""
+        return max(self._opened_at + self.cooldown - time.monotonic(), 0.0)
+
+    def add_listener(self, listener: Callable[[str], None]) -> Callable[[], None]:
+        """Listen to state changes, returns a function removing the listener."""
+
+        self._listeners.append(listener)
+
+        def remove_listener() -> None:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+        return remove_listener
+
+    def acquire(self, request: httpx.Request | None = None) -> bool:
+        """Let a request through, or raise `CircuitOpenError`.
+
+        Returns True if the request is the probe of a half-open circuit.
+        """
+
+        state = self.state
+        if state == STATE_CLOSED:
+            return False
+
+        if state == STATE_HALF_OPEN and not self._probing:
+            self._probing = True
+            self._set_state(STATE_HALF_OPEN)
+            return True
+
+        raise CircuitOpenError(
+            f"XiaoTu servers unavailable, retry in {self.retry_in:.0f}s",
+            request=request,
+        )
+
+    def record(self, success: bool, probe: bool = False) -> None:
+        """Record the outcome of a request which was let through."""
+
+        if probe:
+            self._probing = False
+
+        if success:
+            self._failures = 0
+            self._set_state(STATE_CLOSED)
+            return
+
+        self._failures += 1
+        if self._state == STATE_HALF_OPEN or self._failures >= self.failure_threshold:
+            self._opened_at = time.monotonic()
+            self._set_state(STATE_OPEN)
+
+    def _set_state(self, state: str) -> None:
+        """Update the state and call the listeners on change."""
+
+        if state == self._state:
+            return
+
+        _LOGGER.debug("CircuitBreaker.state: %s -> %s", self._state, state)
+        self._state = state
+
+        for listener in list(self._listeners):
+            listener(state)
+
+
+class CircuitBreakerTransport(httpx.AsyncBaseTransport):
+    """Send requests through a circuit breaker.
+
+    Transport errors and 5xx responses are failures. Requests are counted at
+    the transport, so a login in the auth flow is a request of its own.
+    """
+
+    def __init__(
+        self, transport: httpx.AsyncBaseTransport, breaker: CircuitBreaker
+    ) -> None:
+        """Initialize the transport."""
+
+        self._transport = transport
+        self._breaker = breaker
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        """Send the request if the circuit lets it through."""
+
+        probe = self._breaker.acquire(request)
+
+        success = False
+        try:
+            response = await self._transport.handle_async_request(request)
+            success = response.status_code < 500
+            return response
+        finally:
+            self._breaker.record(success, probe)
+
+    async def aclose(self) -> None:
+        """Close the wrapped transport."""
+        await self._transport.aclose()
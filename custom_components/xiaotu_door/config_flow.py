@@ -7,12 +7,19 @@ from typing import Any
 
 import voluptuous as vol
 
-from homeassistant.config_entries import ConfigFlow, ConfigFlowResult
+from homeassistant.config_entries import (
+    ConfigEntry,
+    ConfigFlow,
+    ConfigFlowResult,
+    OptionsFlow,
+)
 from homeassistant.const import CONF_HOST, CONF_PASSWORD, CONF_USERNAME
+from homeassistant.core import callback
+from homeassistant.helpers.selector import EntitySelector, EntitySelectorConfig
 
 # from homeassistant.core import HomeAssistant
 from .account import XiaoTuAccount
-from .const import DOMAIN
+from .const import CONF_CONFIRM_STATE, CONF_PREWARM, CONF_PREWARM_ENTITIES, DOMAIN
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -30,6 +37,12 @@ class ConfigFlow(ConfigFlow, domain=DOMAIN):
 
     VERSION = 1
 
+    @staticmethod
+    @callback
+    def async_get_options_flow(config_entry: ConfigEntry) -> OptionsFlow:
+        """Get the options flow for this handler."""
+        return XiaoTuOptionsFlow(config_entry)
+
     async def async_step_user(
         self, user_input: dict[str, Any] | None = None
     ) -> ConfigFlowResult:
@@ -44,7 +57,10 @@ class ConfigFlow(ConfigFlow, domain=DOMAIN):
                 # }
 
                 account = XiaoTuAccount(user_input)
-                user = await account.get_user()
+                try:
+                    user = await account.get_user()
+                finally:
+                    await account.api.aclose()
 
                 # Add init token
                 auth = account.api.auth
@@ -67,3 +83,43 @@ class ConfigFlow(ConfigFlow, domain=DOMAIN):
         return self.async_show_form(
             step_id="user", data_schema=STEP_USER_DATA_SCHEMA, errors=errors
         )
+
+
+class XiaoTuOptionsFlow(OptionsFlow):
+    """Handle XiaoTu Door options."""
+
+    def __init__(self, config_entry: ConfigEntry) -> None:
+        """Initialize options flow."""
+        self.options = dict(config_entry.options)
+
+    async def async_step_init(
+        self, user_input: dict[str, Any] | None = None
+    ) -> ConfigFlowResult:
+        """Manage the options."""
+        if user_input is not None:
+            return self.async_create_entry(data={**self.options, **user_input})
+
+        return self.async_show_form(
+            step_id="init",
+            data_schema=vol.Schema(
+                {
+                    vol.Optional(
+                        CONF_CONFIRM_STATE,
+                        default=self.options.get(CONF_CONFIRM_STATE, False),
+                    ): bool,
+                    vol.Optional(
+                        CONF_PREWARM,
+                        default=self.options.get(CONF_PREWARM, False),
+                    ): bool,
+                    vol.Optional(
+                        CONF_PREWARM_ENTITIES,
+                        default=self.options.get(CONF_PREWARM_ENTITIES, []),
+                    ): EntitySelector(
+                        EntitySelectorConfig(
+                            domain=["person", "device_tracker", "binary_sensor"],
+                            multiple=True,
+                        )
+                    ),
+                }
+            ),
+        )
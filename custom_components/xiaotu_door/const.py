@@ -6,10 +6,75 @@ DOMAIN = "xiaotu_door"
 
 CONF_ACCOUNT = "account"
 CONF_REFRESH_TOKEN = "refresh_token"
+CONF_CONFIRM_STATE = "confirm_state"
+CONF_PREWARM = "prewarm"
+CONF_PREWARM_ENTITIES = "prewarm_entities"
 
 DEFAULT_API_HOST = "https://wap.anjucloud.com"
 X_USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/107.0.0.0 Safari/537.36 MicroMessenger/6.8.0(0x16080000) NetType/WIFI MiniProgramEnv/Mac MacWechat/WMPF MacWechat/3.8.7(0x13080710) XWEB/1191"
 HTTPX_TIMEOUT = 30.0
 
+# Timeouts in seconds, polling requests use HTTPX_TIMEOUT as deadline
+POLL_CONNECT_TIMEOUT = 10.0
+COMMAND_TIMEOUT = 5.0
+COMMAND_CONNECT_TIMEOUT = 3.0
+LOGIN_TIMEOUT = 10.0
+
+# Bound of a lock command, including the login, retries and confirmation
+COMMAND_DEADLINE = datetime.timedelta(seconds=15)
+
 AUTH_VALID_OFFSET = datetime.timedelta(hours=5)
 EXPIRES_AT_OFFSET = datetime.timedelta(seconds=HTTPX_TIMEOUT * 2)
+
+# How often the door list is synced with the servers, at least
+DOOR_SYNC_INTERVAL = datetime.timedelta(minutes=30)
+
+# Adaptive polling: fast for a while after a command or an arrival, then
+# backing off exponentially up to DOOR_SYNC_INTERVAL when idle or failing
+POLL_INTERVAL_ACTIVE = datetime.timedelta(seconds=30)
+POLL_ACTIVE_DURATION = datetime.timedelta(minutes=5)
+POLL_INTERVAL_IDLE = datetime.timedelta(minutes=2)
+POLL_INTERVAL_MAX = DOOR_SYNC_INTERVAL
+
+# How long an opened door is shown as unlocked
+AUTO_RELOCK_DELAY = datetime.timedelta(seconds=5)
+
+# Equal commands for a door within this window are sent only once
+COMMAND_COALESCE_WINDOW = datetime.timedelta(seconds=2)
+COMMAND_MAX_CONCURRENT = 4
+
+# Request budgets of an account, in requests per second and burst size.
+# Commands have their own budget, so background polling never delays them.
+RATE_LIMIT_POLL = (0.5, 5)
+RATE_LIMIT_COMMAND = (2.0, 4)
+
+# Jittered exponential backoff between retries of a request
+RETRY_BACKOFF_MIN = datetime.timedelta(seconds=1)
+RETRY_BACKOFF_MAX = datetime.timedelta(seconds=30)
+
+# Circuit breaker: consecutive failures opening it, and the time until a
+# single probe request may test the servers again
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_COOLDOWN = datetime.timedelta(seconds=60)
+
+# Bytes of response content captured per account for the diagnostics
+CAPTURE_MAX_BYTES = 256 * 1024
+
+# Domain wide scheduling of the config entries, see scheduler.py
+UPSTREAM_MAX_CONCURRENT = 8
+STARTUP_SPREAD = datetime.timedelta(seconds=60)
+AUTH_REFRESH_SPREAD = datetime.timedelta(minutes=15)
+
+# Keep a connection alive, shorter than the keep-alive expiry of the pool
+PREWARM_INTERVAL = datetime.timedelta(seconds=45)
+
+# Upper bound for the first refresh when there is no cached data
+SETUP_TIMEOUT = datetime.timedelta(seconds=HTTPX_TIMEOUT)
+
+STORAGE_VERSION = 1
+STORAGE_SAVE_DELAY = 10
+STORAGE_USER_TTL = datetime.timedelta(days=7)
+STORAGE_DOORS_TTL = datetime.timedelta(days=1)
+
+AUTH_REFRESH_BACKOFF_MIN = datetime.timedelta(seconds=5)
+AUTH_REFRESH_BACKOFF_MAX = datetime.timedelta(minutes=5)
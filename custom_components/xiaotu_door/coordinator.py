@@ -2,18 +2,53 @@
 
 from __future__ import annotations
 
+import asyncio
+from collections.abc import Callable
+import datetime
 import logging
+from typing import Any
 
 from httpx import RequestError
 
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.core import HomeAssistant
+from homeassistant.const import STATE_HOME, STATE_ON
+from homeassistant.core import (
+    CALLBACK_TYPE,
+    Event,
+    HassJob,
+    HomeAssistant,
+    callback,
+)
 from homeassistant.exceptions import ConfigEntryAuthFailed
+from homeassistant.helpers.event import (
+    async_call_later,
+    async_track_state_change_event,
+    async_track_time_interval,
+)
 from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
 
 from .account import XiaoTuAccount
-from .const import AUTH_VALID_OFFSET, DOMAIN
-from .utils import APIError, AuthError
+from .circuit import STATE_OPEN
+from .const import (
+    AUTH_REFRESH_BACKOFF_MAX,
+    AUTH_REFRESH_BACKOFF_MIN,
+    AUTH_REFRESH_SPREAD,
+    AUTH_VALID_OFFSET,
+    CONF_PREWARM,
+    CONF_PREWARM_ENTITIES,
+    DOMAIN,
+    POLL_ACTIVE_DURATION,
+    POLL_INTERVAL_ACTIVE,
+    POLL_INTERVAL_IDLE,
+    POLL_INTERVAL_MAX,
+    PREWARM_INTERVAL,
+    STORAGE_DOORS_TTL,
+    STORAGE_USER_TTL,
+)
+from .dao import DaoEntity
+from .scheduler import async_get_scheduler
+from .store import XiaoTuStore
+from .utils import APIError, AuthError, QuotaError, get_now
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -27,7 +62,13 @@ class XiaoTuCoordinator(DataUpdateCoordinator[None]):
         """Initialize a data updater."""
 
         self.config_entry = entry
-        self.account = XiaoTuAccount(entry.data)
+        self.scheduler = async_get_scheduler(hass)
+        self.account = XiaoTuAccount(entry.data, limiter=self.scheduler.limiter)
+        self.store = XiaoTuStore(hass, entry.entry_id)
+
+        # Force a full re-fetch on the next update after restoring from cache
+        self._revalidate = False
+        self.cache_fresh = False
 
         # Remove init token from entry data
         data = entry.data.copy()
@@ -39,25 +80,69 @@ class XiaoTuCoordinator(DataUpdateCoordinator[None]):
             hass,
             _LOGGER,
             name=f"{DOMAIN}.{entry.entry_id}",
-            update_interval=AUTH_VALID_OFFSET / 2,
+            update_interval=POLL_INTERVAL_IDLE,
         )
 
+        # Adaptive polling state, see _adapt_update_interval
+        self._poll_interval = POLL_INTERVAL_IDLE
+        self._active_until: datetime.datetime | None = None
+        self._idle_polls = 0
+        self._failed_polls = 0
+
         # Default to false on init so _async_update_data logic works
         self.last_update_success = False
 
+        # Background token renewal, independent from the data updates
+        self._auth_refresh_job = HassJob(
+            self._handle_auth_refresh,
+            f"{DOMAIN}.{entry.entry_id}.auth_refresh",
+            cancel_on_shutdown=True,
+        )
+        self._auth_refresh_unsub: CALLBACK_TYPE | None = None
+        self._auth_refresh_failures = 0
+
+        # Probe the servers when an open circuit lets requests through again
+        self._circuit_probe_job = HassJob(
+            self._handle_circuit_probe,
+            f"{DOMAIN}.{entry.entry_id}.circuit_probe",
+            cancel_on_shutdown=True,
+        )
+        self._circuit_probe_unsub: CALLBACK_TYPE | None = None
+        self._circuit_unsub = self.account.api.circuit_breaker.add_listener(
+            self._async_handle_circuit_change
+        )
+
+        # Versions of the DaoEntity contexts at the last notification
+        self._notified_versions: dict[DaoEntity, int] = {}
+        self._notified_success: bool | None = None
+
     async def _async_update_data(self) -> None:
         """Fetch data from XiaoTu."""
         # old_refresh_token = self.account.refresh_token
 
+        force_init = self._revalidate
+
         try:
-            await self.account.get_devices()
+            await self.account.bootstrap(force_init=force_init, sync_entities=True)
         except AuthError as err:
             # Clear refresh token and trigger reauth if previous update failed as well
             self._update_config_entry_refresh_token(None)
             raise ConfigEntryAuthFailed(err) from err
+        except QuotaError as err:
+            self._adapt_update_interval(failed=True, retry_after=err.retry_after)
+            raise UpdateFailed(f"Rate limited by the servers: {err}") from err
         except (APIError, RequestError) as err:
+            self._adapt_update_interval(failed=True)
             raise UpdateFailed(err) from err
 
+        self._adapt_update_interval(failed=False)
+        self._revalidate = False
+        self._async_save_cache()
+
+        # Keep a warm token once we have one
+        if self._auth_refresh_unsub is None:
+            self._schedule_auth_refresh()
+
         # if self.account.refresh_token != old_refresh_token:
         #     self._update_config_entry_refresh_token(self.account.refresh_token)
         #     _LOGGER.debug(
@@ -66,6 +151,346 @@ class XiaoTuCoordinator(DataUpdateCoordinator[None]):
         #         self.account.refresh_token,
         #     )
 
+    def _adapt_update_interval(
+        self, failed: bool, retry_after: float | None = None
+    ) -> None:
+        """Pick the interval until the next poll.
+
+        Polls every POLL_INTERVAL_ACTIVE while active, otherwise the interval
+        doubles with every idle or failed poll, up to POLL_INTERVAL_MAX. The
+        `Retry-After` of a quota error is always respected.
+        """
+        if failed:
+            self._failed_polls += 1
+            backoff = 2 ** min(self._failed_polls - 1, 16)
+            interval = min(POLL_INTERVAL_IDLE * backoff, POLL_INTERVAL_MAX)
+            if retry_after:
+                interval = max(interval, datetime.timedelta(seconds=retry_after))
+        elif self._active_until and get_now() < self._active_until:
+            self._failed_polls = 0
+            interval = POLL_INTERVAL_ACTIVE
+        else:
+            self._failed_polls = 0
+            backoff = 2 ** min(self._idle_polls, 16)
+            interval = min(POLL_INTERVAL_IDLE * backoff, POLL_INTERVAL_MAX)
+            self._idle_polls += 1
+
+        if interval != self._poll_interval:
+            _LOGGER.debug("Polling interval: %s", interval)
+
+        self._poll_interval = interval
+        self.update_interval = self.scheduler.get_next_slot(
+            self.config_entry.entry_id, interval
+        )
+
+    @callback
+    def async_boost_polling(self) -> None:
+        """Poll faster for a while, after a command or when someone arrives."""
+        self._active_until = get_now() + POLL_ACTIVE_DURATION
+        self._idle_polls = 0
+
+        # Failures keep backing off, the servers are not doing well
+        if self._failed_polls or self._poll_interval == POLL_INTERVAL_ACTIVE:
+            return
+
+        _LOGGER.debug("Polling interval: %s", POLL_INTERVAL_ACTIVE)
+        self._poll_interval = POLL_INTERVAL_ACTIVE
+        self.update_interval = self.scheduler.get_next_slot(
+            self.config_entry.entry_id, POLL_INTERVAL_ACTIVE
+        )
+        self._schedule_refresh()
+
+    async def async_revalidate(self, delay: float = 0) -> None:
+        """Refresh the data restored from the cache after `delay` seconds."""
+
+        if delay:
+            await asyncio.sleep(delay)
+
+        await self.async_refresh()
+
+    @callback
+    def async_add_listener(
+        self, update_callback: CALLBACK_TYPE, context: Any = None
+    ) -> Callable[[], None]:
+        """Listen for data updates, entities are up to date when added."""
+        if isinstance(context, DaoEntity):
+            self._notified_versions[context] = context.version
+
+        return super().async_add_listener(update_callback, context)
+
+    @callback
+    def async_update_listeners(self) -> None:
+        """Update listeners whose data changed since the last notification.
+
+        Listeners with a DaoEntity context are only called when its version
+        changed, all listeners are called when the availability changed.
+        """
+        notify_all = self._notified_success != self.last_update_success
+        self._notified_success = self.last_update_success
+
+        notified_versions = self._notified_versions
+        versions: dict[DaoEntity, int] = {}
+
+        for update_callback, context in list(self._listeners.values()):
+            if isinstance(context, DaoEntity):
+                versions[context] = context.version
+                if not notify_all and notified_versions.get(context) == context.version:
+                    continue
+
+            update_callback()
+
+        self._notified_versions = versions
+
+    async def async_restore(self) -> bool:
+        """Restore token, user info and doors from the cache.
+
+        Returns True if there is enough data to set up the entities without
+        waiting for the servers, they are revalidated on the next update.
+        Data older than its TTL is still restored, but `cache_fresh` is False
+        and the entities stay unavailable until the servers confirm it.
+        """
+        store = self.store
+        account = self.account
+        await store.async_load()
+
+        cached_token = store.get("token", AUTH_VALID_OFFSET)
+        if cached_token:
+            token, fetched_at = cached_token
+            auth = account.api.auth
+            if not auth.fetched_at or auth.fetched_at < fetched_at:
+                account.api.restore_auth(token["token_id"], fetched_at)
+
+        cached_user = store.get("user")
+        cached_doors = store.get("doors")
+        if not cached_user or not cached_doors:
+            return False
+
+        now = get_now()
+        self.cache_fresh = (
+            cached_user[1] + STORAGE_USER_TTL >= now
+            and cached_doors[1] + STORAGE_DOORS_TTL >= now
+        )
+
+        user_data, user_fetched_at = cached_user
+        user = account.restore_user(user_data)
+        user.fetched_at = user_fetched_at
+
+        devices = await account.get_devices()
+        doors, doors_fetched_at = cached_doors
+        for device in devices:
+            device.restore_entities(doors.get(device.id, []))
+            device.fetched_at = doors_fetched_at
+
+        _LOGGER.info(
+            "XiaoTuCoordinator.restore: %s doors, fresh: %s",
+            sum(len(device.entities) for device in devices),
+            self.cache_fresh,
+        )
+
+        self._revalidate = True
+        return True
+
+    @callback
+    def _async_save_cache(self) -> None:
+        """Save the token, user info and doors which changed to the cache.
+
+        An unchanged door list is saved again once older than half its TTL,
+        so a restart still finds it fresh.
+        """
+        store = self.store
+        account = self.account
+
+        auth = account.api.auth
+        cached_token = store.get("token")
+        if (
+            auth.token_id
+            and auth.fetched_at
+            and (not cached_token or cached_token[0] != {"token_id": auth.token_id})
+        ):
+            store.async_set("token", {"token_id": auth.token_id}, auth.fetched_at)
+
+        user = account.user
+        user_data = account.dump_user()
+        cached_user = store.get("user")
+        if user.userId and (
+            not cached_user
+            or cached_user[0] != user_data
+            or cached_user[1] != user.fetched_at
+        ):
+            store.async_set("user", user_data, user.fetched_at)
+
+        cached_doors = store.get("doors")
+        if (
+            not cached_doors
+            or cached_doors[0].keys() != {device.id for device in account.devices}
+            or any(device.last_changes for device in account.devices)
+            or cached_doors[1] + STORAGE_DOORS_TTL / 2 < get_now()
+        ):
+            store.async_set(
+                "doors",
+                {device.id: device.dump_entities() for device in account.devices},
+            )
+
+    @callback
+    def async_setup_presence(self) -> None:
+        """Track the presence entities and the connection warm up options.
+
+        Polling is boosted when one of the presence entities comes home. If
+        enabled, the connection is also kept alive periodically and re-opened
+        on arrival.
+        """
+        entry = self.config_entry
+        if entry.options.get(CONF_PREWARM):
+            entry.async_on_unload(
+                async_track_time_interval(
+                    self.hass, self._async_prewarm, PREWARM_INTERVAL
+                )
+            )
+
+        if entities := entry.options.get(CONF_PREWARM_ENTITIES):
+            entry.async_on_unload(
+                async_track_state_change_event(
+                    self.hass, entities, self._async_handle_presence
+                )
+            )
+
+    @callback
+    def _async_handle_presence(self, event: Event) -> None:
+        """Poll faster and warm up the connection when someone arrives."""
+        arrived = (STATE_HOME, STATE_ON)
+        old_state = event.data["old_state"]
+        new_state = event.data["new_state"]
+
+        # Only on arrival, not on attribute updates while at home
+        if not new_state or new_state.state not in arrived:
+            return
+        if old_state and old_state.state in arrived:
+            return
+
+        self.async_boost_polling()
+
+        if self.config_entry.options.get(CONF_PREWARM):
+            self.config_entry.async_create_background_task(
+                self.hass, self._async_prewarm(), f"{DOMAIN}.prewarm"
+            )
+
+    async def _async_prewarm(self, _now: datetime.datetime | None = None) -> None:
+        """Warm up the connection to the servers."""
+        try:
+            connect_time = await self.account.api.warm_up()
+        except (APIError, RequestError) as err:
+            _LOGGER.debug("Connection warm up failed: %s", err)
+            return
+
+        _LOGGER.debug("Connection warm up, connect time: %.3fs", connect_time)
+
+    async def async_shutdown(self) -> None:
+        """Cancel any scheduled refresh, and ignore new runs."""
+        self._cancel_auth_refresh()
+        self._cancel_circuit_probe()
+        self._circuit_unsub()
+
+        await super().async_shutdown()
+
+        # Release the shared connections
+        await self.account.api.aclose()
+
+    @callback
+    def _async_handle_circuit_change(self, state: str) -> None:
+        """Update the availability of all entities, probe an open circuit."""
+
+        # Availability depends on the circuit, notify all listeners
+        self._notified_success = None
+        self.async_update_listeners()
+
+        self._cancel_circuit_probe()
+        if state == STATE_OPEN:
+            self._circuit_probe_unsub = async_call_later(
+                self.hass,
+                self.account.api.circuit_breaker.retry_in,
+                self._circuit_probe_job,
+            )
+
+    @callback
+    def _cancel_circuit_probe(self) -> None:
+        """Cancel the scheduled probe of an open circuit."""
+        if self._circuit_probe_unsub:
+            self._circuit_probe_unsub()
+            self._circuit_probe_unsub = None
+
+    async def _handle_circuit_probe(self, _now: datetime.datetime) -> None:
+        """Refresh once the circuit is half-open, the refresh is the probe."""
+        self._circuit_probe_unsub = None
+        await self.async_request_refresh()
+
+    @callback
+    def _schedule_auth_refresh(self, delay: datetime.timedelta | None = None) -> None:
+        """Schedule the next background token renewal.
+
+        Without `delay` the renewal is due `auth_refresh_margin` seconds before
+        the current token expires, spread over AUTH_REFRESH_SPREAD by entry.
+        """
+        self._cancel_auth_refresh()
+
+        if delay is None:
+            refresh_at = self._get_auth_refresh_at()
+            delay = refresh_at - get_now() if refresh_at else datetime.timedelta(0)
+
+        delay_seconds = max(delay.total_seconds(), 0)
+        _LOGGER.debug("Next token refresh in %.1fs", delay_seconds)
+
+        self._auth_refresh_unsub = async_call_later(
+            self.hass, delay_seconds, self._auth_refresh_job
+        )
+
+    def _get_auth_refresh_at(self) -> datetime.datetime | None:
+        """Get the time of the background token renewal of this entry."""
+
+        refresh_at = self.account.api.auth_refresh_at
+        if refresh_at is None:
+            return None
+
+        return refresh_at - self.scheduler.get_offset(
+            self.config_entry.entry_id, AUTH_REFRESH_SPREAD
+        )
+
+    @callback
+    def _cancel_auth_refresh(self) -> None:
+        """Cancel the scheduled token renewal."""
+        if self._auth_refresh_unsub:
+            self._auth_refresh_unsub()
+            self._auth_refresh_unsub = None
+
+    async def _handle_auth_refresh(self, _now: datetime.datetime) -> None:
+        """Renew the token in the background, retry with backoff on failure."""
+        self._auth_refresh_unsub = None
+        api = self.account.api
+
+        # The token may have been renewed by a request in the meantime
+        refresh_at = self._get_auth_refresh_at()
+        if refresh_at and refresh_at > get_now():
+            self._schedule_auth_refresh()
+            return
+
+        try:
+            await api.refresh_auth()
+        except (APIError, RequestError) as err:
+            delay = min(
+                AUTH_REFRESH_BACKOFF_MIN * 2 ** min(self._auth_refresh_failures, 16),
+                AUTH_REFRESH_BACKOFF_MAX,
+            )
+            self._auth_refresh_failures += 1
+
+            _LOGGER.warning(
+                "Token refresh failed, retry in %ss: %s", delay.total_seconds(), err
+            )
+            self._schedule_auth_refresh(delay)
+            return
+
+        self._auth_refresh_failures = 0
+        self._async_save_cache()
+        self._schedule_auth_refresh()
+
     def _update_config_entry_refresh_token(self, refresh_token: str | None) -> None:
         """Update or delete the refresh_token in the Config Entry."""
         # data = {
@@ -1,11 +1,14 @@
 """DAO."""
 
 import asyncio
-from dataclasses import dataclass
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
 import logging
+import sys
 from typing import TYPE_CHECKING
 
-from .utils import AuthError, get_now
+from .const import COMMAND_COALESCE_WINDOW, COMMAND_DEADLINE, COMMAND_MAX_CONCURRENT
+from .utils import APIError, get_digest, get_now
 
 if TYPE_CHECKING:
     from .entity import BaseEntity
@@ -13,50 +16,201 @@ if TYPE_CHECKING:
 _LOGGER = logging.getLogger(__name__)
 
 
-@dataclass
 class DaoEntity:
-    """Base Entity for DAO."""
-
-    data: dict
-
-    def __init__(self, data: dict) -> None:
+    """Base Entity for DAO.
+
+    Only the fields used by the integration are kept. Other fields of the
+    server data are dropped, unless `keep_extras` is set.
+    """
+
+    FIELDS = (
+        "id",
+        "doorId",
+        "name",
+        "type",
+        "_type",
+        "isOpen",
+        "status",
+        "doorType",
+        "image",
+    )
+
+    FIELD_SET = frozenset(FIELDS)
+
+    # Fields with few distinct values, interned to share the strings
+    INTERNED_FIELDS = frozenset(("type", "_type", "isOpen", "status", "doorType"))
+
+    __slots__ = (*FIELDS, "extras", "version")
+
+    id: str
+    doorId: str | None  # noqa: N815
+    name: str
+    type: str
+    _type: str | None
+    isOpen: str | None  # noqa: N815
+    status: str | None
+    doorType: str | None  # noqa: N815
+    image: str | None
+    extras: dict | None
+    # Incremented on every update which changes a value
+    version: int
+
+    def __init__(self, data: dict, keep_extras: bool = False) -> None:
         """Initialize entity."""
-        self.data = {}
+        self.id = ""
+        self.name = ""
+        self.type = ""
+        self.doorId = self._type = self.isOpen = self.status = None
+        self.doorType = self.image = None
+
+        self.extras = {} if keep_extras else None
+        self.version = 0
 
         self.update(data)
 
     def get(self, key: str, default_val=""):
         """Get value by key."""
-        return self.data.get(key, default_val)
+        if key in self.FIELD_SET:
+            value = getattr(self, key)
+        elif self.extras:
+            value = self.extras.get(key)
+        else:
+            value = None
+
+        return default_val if value is None else value
 
     def update(self, data: dict) -> None:
         """Update the state."""
-        self.data.update(data)
+        fields = self.FIELD_SET
+        extras = self.extras
+        changed = False
+
+        for key, value in data.items():
+            if key in fields:
+                if key in self.INTERNED_FIELDS and isinstance(value, str):
+                    value = sys.intern(value)
+                if getattr(self, key) != value:
+                    setattr(self, key, value)
+                    changed = True
+            elif extras is not None and extras.get(key) != value:
+                extras[sys.intern(key)] = value
+                changed = True
+
+        if changed:
+            self.version += 1
+
+    def as_dict(self) -> dict:
+        """Get the entity data as a dict."""
+        data = {
+            key: value
+            for key in self.FIELDS
+            if (value := getattr(self, key)) is not None
+        }
+        if self.extras:
+            data.update(self.extras)
+
+        return data
 
-    @property
-    def id(self) -> str:
-        """Get id of the entity."""
-        return self.data.get("id", "")
 
-    @property
-    def type(self) -> str:
-        """Get type of the entity."""
-        return self.data.get("type", "")
+@dataclass
+class EntityChanges:
+    """Entities changed by a sync with the servers."""
 
-    @property
-    def name(self) -> str:
-        """Get name of the entity."""
-        return self.data.get("name", "")
+    added: list[DaoEntity] = field(default_factory=list)
+    changed: list[DaoEntity] = field(default_factory=list)
+    removed: list[DaoEntity] = field(default_factory=list)
+
+    def __bool__(self) -> bool:
+        """Check if anything changed."""
+        return bool(self.added or self.changed or self.removed)
+
+
+class CommandDispatcher:
+    """Dispatch the commands of a device to the servers.
+
+    - Commands for the same door run one after another, in call order.
+    - A command equal to the last one queued for a door joins it while it is
+      in flight, or if it was queued less than `coalesce_window` seconds ago.
+    - Commands for different doors run concurrently, up to `max_concurrent`.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = COMMAND_MAX_CONCURRENT,
+        coalesce_window: float = COMMAND_COALESCE_WINDOW.total_seconds(),
+    ) -> None:
+        """Initialize the dispatcher."""
+
+        self.coalesce_window = coalesce_window
+
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._door_locks: dict[str, asyncio.Lock] = {}
+        # Last command per door: (action, task, queued at)
+        self._last_commands: dict[str, tuple[str, asyncio.Task, float]] = {}
+
+    async def dispatch(
+        self, door_id: str, action: str, command: Callable[[], Awaitable[None]]
+    ) -> None:
+        """Run `command` for the door, or join an equal command."""
+
+        loop = asyncio.get_running_loop()
+
+        last_command = self._last_commands.get(door_id)
+        if last_command:
+            last_action, task, queued_at = last_command
+            if last_action == action and (
+                not task.done()
+                or (
+                    not task.cancelled()
+                    and task.exception() is None
+                    and loop.time() - queued_at < self.coalesce_window
+                )
+            ):
+                _LOGGER.debug("Join %s command of door %s", action, door_id)
+                return await asyncio.shield(task)
+
+        task = asyncio.create_task(self._run(door_id, command))
+        task.add_done_callback(self._retrieve_exception)
+        self._last_commands[door_id] = (action, task, loop.time())
+
+        # Shield the command so a cancelled caller does not abort it for the others
+        return await asyncio.shield(task)
+
+    async def _run(self, door_id: str, command: Callable[[], Awaitable[None]]) -> None:
+        """Run a command once previous commands for the door are done."""
+
+        door_lock = self._door_locks.setdefault(door_id, asyncio.Lock())
+
+        async with door_lock, self._semaphore:
+            await command()
+
+    @staticmethod
+    def _retrieve_exception(task: asyncio.Task) -> None:
+        """Mark exceptions as retrieved if no caller is waiting anymore."""
+
+        if not task.cancelled():
+            task.exception()
 
 
 class BaseDevice:
     """Base Device."""
 
+    # Keep server fields which are not used by the integration
+    keep_entity_extras = False
+
     def __init__(self, account, base_data: dict) -> None:
         """Initialize entity."""
 
         self.account = account
         self.entities: list[DaoEntity] = []
+        self.commands = CommandDispatcher()
+
+        # Lookup index of `self.entities`, by case folded id
+        self._entities_by_id: dict[str, DaoEntity] = {}
+
+        # Digest of the last server record of each entity, by case folded id
+        self._entity_digests: dict[str, int] = {}
+        self.last_changes = EntityChanges()
         self.fetched_at = None
 
         self.id = ""
@@ -66,52 +220,119 @@ class BaseDevice:
 
         self.update_state(base_data)
 
-    async def _init_entities(self) -> None:
-        """Initialize entities from servers."""
+    async def _init_entities(self, doors: list[dict] | None = None) -> None:
+        """Initialize entities from servers.
+
+        :param doors: Door list already fetched by the account, if any.
+        """
         _LOGGER.debug("Init entity list")
 
-        entities = self.entities
-        if len(entities) == 0:
-            auth = await self.api.get_auth()
-            params = {
-                "tokenId": auth.token_id,
-            }
+        ret = doors if doors is not None else await self.account.get_doors()
 
-            res = await self.api.get(
-                "/wap/door/getDoor",
-                params=params,
-                headers={
-                    "tokenId": auth.token_id,
-                },
+        self.last_changes = self.sync_entities(ret)
+        self.fetched_at = get_now()
+
+        if self.last_changes:
+            _LOGGER.debug(
+                "Entity changes: %s added, %s changed, %s removed",
+                len(self.last_changes.added),
+                len(self.last_changes.changed),
+                len(self.last_changes.removed),
             )
-            ret = res.json()["result"]
 
-            for info in ret:
-                # Filter doorType is door and status is 0
-                if info["doorType"] != "door" and info["status"] != "0":
-                    continue
+    def sync_entities(self, doors: list[dict]) -> EntityChanges:
+        """Apply a complete door list from servers to the entities.
 
-                # Override type
-                info["_type"] = info["type"]
-                info["type"] = "lock"
+        Records are compared by digest, unchanged records are skipped.
+        """
 
-                self.add_entity(info)
+        changes = EntityChanges()
+        digests = self._entity_digests
+        seen: set[str] = set()
+
+        for info in doors:
+            key = info["id"].casefold()
+            digest = get_digest(info)
+            if digests.get(key) == digest:
+                seen.add(key)
+                continue
+
+            data = self._parse_entity_data(info)
+            if not data:
+                continue
+
+            seen.add(key)
+            digests[key] = digest
+
+            entity = self.get_entity(data["id"])
+            if entity:
+                self._update_entity(entity, data)
+                changes.changed.append(entity)
+            else:
+                changes.added.append(self._add_entity(data))
+
+        for entity in list(self.entities):
+            if entity.id.casefold() not in seen:
+                self.remove_entity(entity.id)
+                changes.removed.append(entity)
+
+        return changes
+
+    def _parse_entity_data(self, info: dict) -> dict | None:
+        """Parse raw entity data from servers, None if it is not supported."""
+
+        # Filter doorType is door and status is 0
+        if info["doorType"] != "door" and info["status"] != "0":
+            return None
+
+        # Override type, on a copy as the list may be shared by devices
+        info = dict(info)
+        info["_type"] = info["type"]
+        info["type"] = "lock"
+
+        return info
+
+    async def refresh_entity(self, entity: DaoEntity) -> DaoEntity:
+        """Re-fetch the state of a single entity from servers."""
+
+        for info in await self.account.get_doors():
+            if self.get_entity(info["id"]) is entity:
+                data = self._parse_entity_data(info)
+                if data:
+                    self._update_entity(entity, data)
+                    # Applied like by `sync_entities`, so the next sync compares
+                    # with this record
+                    self._entity_digests[entity.id.casefold()] = get_digest(info)
+                break
 
-        self.fetched_at = get_now()
+        return entity
+
+    def restore_entities(self, entities: list[dict]) -> None:
+        """Restore entities from a previous session."""
 
-    async def get_entities(self, force_init: bool = False) -> list[DaoEntity]:
+        for data in entities:
+            self.add_entity(data)
+
+    def dump_entities(self) -> list[dict]:
+        """Get the entity data as a serializable list."""
+        return [entity.as_dict() for entity in self.entities]
+
+    async def get_entities(
+        self, force_init: bool = False, doors: list[dict] | None = None
+    ) -> list[DaoEntity]:
         """Retrieve entity data from servers."""
 
-        if len(self.entities) == 0 or force_init:
-            await self._init_entities()
+        if doors is not None or self.fetched_at is None or force_init:
+            await self._init_entities(doors)
 
         return self.entities
 
     def _add_entity(self, data: dict) -> DaoEntity:
         """Add a entity."""
 
-        entity = DaoEntity(data)
+        entity = DaoEntity(data, keep_extras=self.keep_entity_extras)
         self.entities.append(entity)
+        self._index_entity(entity)
         return entity
 
     def add_entity(self, data: dict) -> DaoEntity:
@@ -121,12 +342,24 @@ class BaseDevice:
 
         # If entity already exists, just update it's state
         if entity:
-            entity.update_state(data)
+            self._update_entity(entity, data)
+            self._forget_digest(entity)
         else:
             entity = self._add_entity(data)
 
         return entity
 
+    def remove_entity(self, id: str) -> DaoEntity | None:
+        """Remove the DaoEntity with given id, if any."""
+
+        entity = self.get_entity(id)
+        if entity:
+            self._unindex_entity(entity)
+            self._forget_digest(entity)
+            self.entities.remove(entity)
+
+        return entity
+
     def get_entity(self, id: str) -> DaoEntity | None:
         """Get DaoEntity with given id.
 
@@ -134,15 +367,29 @@ class BaseDevice:
         :param id: ID of the entity you want to get.
         :return: Returns None if no entity is found.
         """
-        for entity in self.entities:
-            if entity.id.upper() == id.upper():
-                return entity
-        return None
+        return self._entities_by_id.get(id.casefold())
+
+    def _index_entity(self, entity: DaoEntity) -> None:
+        """Add the entity to the lookup index."""
+        self._entities_by_id[entity.id.casefold()] = entity
+
+    def _unindex_entity(self, entity: DaoEntity) -> None:
+        """Remove the entity from the lookup index."""
+        self._entities_by_id.pop(entity.id.casefold(), None)
 
     def _update_entity(self, entity: DaoEntity, data: dict) -> None:
         """Update entity with given data."""
+
+        # Keep the index in sync if the id changes
+        reindex = "id" in data and data["id"] != entity.id
+        if reindex:
+            self._unindex_entity(entity)
+
         entity.update(data)
 
+        if reindex:
+            self._index_entity(entity)
+
     def update_entity(self, idOrEntity: str | DaoEntity, data: dict) -> None:
         """Update entity with given data."""
         entity = (
@@ -152,37 +399,60 @@ class BaseDevice:
         )
         if entity:
             self._update_entity(entity, data)
+            self._forget_digest(entity)
+
+    def _forget_digest(self, entity: DaoEntity) -> None:
+        """Drop the digest of an entity changed outside `sync_entities`."""
+        self._entity_digests.pop(entity.id.casefold(), None)
 
     async def _push_entity_state(self, entity, data: dict) -> None:
         """Push state to server."""
         account = entity.coordinator.account
         await account.get_entities()
 
-    async def push_entity_state(self, entity, data: dict) -> None:
-        """Push state to server."""
+    async def push_entity_state(
+        self, entity, data: dict, confirm: bool = False
+    ) -> None:
+        """Push state to server.
+
+        Returns as soon as the server accepted the command, the caller is
+        responsible for updating the entity state. Repeated commands for the
+        same door are coalesced by `self.commands`. The command fails after
+        COMMAND_DEADLINE, including the time waiting for other commands, a
+        login and retries.
+        :param confirm: Re-fetch the entity state from servers afterwards.
+        """
 
-        try:
-            try:
-                await self._push_entity_state(entity, data)
-            except AuthError:
-                # Try again when the authorization expires
+        dao_entity = entity.daoEntity
+        action = "lock" if data.get("is_locked") else "unlock"
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + COMMAND_DEADLINE.total_seconds()
+
+        async def command() -> None:
+            async with asyncio.timeout_at(deadline):
                 await self._push_entity_state(entity, data)
 
-            # Always delay for a few seconds
-            await asyncio.sleep(1.8)
-        finally:
-            self.update_state(data)
+                if confirm:
+                    await self.refresh_entity(dao_entity)
 
-            # Always update the listeners to get the latest state
-            if entity.coordinator:
-                entity.coordinator.async_update_listeners()
+        try:
+            await self.commands.dispatch(
+                dao_entity.get("doorId") or dao_entity.id, action, command
+            )
+        except TimeoutError as err:
+            raise APIError(
+                f"Door {action} timed out after "
+                f"{COMMAND_DEADLINE.total_seconds():.0f}s",
+                request=None,
+                response=None,
+            ) from err
+
+        self.update_state(data)
 
     async def push_state(self, entity, data: dict) -> None:
         """Push state to server."""
 
-        # Simulate a push to the server
-        await asyncio.sleep(0.8)
-
         self.update_state(data)
 
         # Always update the listeners to get the latest state
@@ -216,26 +486,26 @@ class XiaoTuDevice(BaseDevice):
 
         self.brand_name = "XiaoTu"
 
-    def _update_entity(self, entity: DaoEntity, data: dict) -> None:
-        """Update entity with given data."""
-        super()._update_entity(data)
+    def _parse_entity_data(self, info: dict) -> dict | None:
+        """Parse raw entity data from servers, None if it is not supported."""
+        data = super()._parse_entity_data(info)
 
         # self.is_locked = data.get("isOpen", "2") == "2"
 
-        img_map = data.get("imageItem", {})
-        self.data.update(
-            {"image": img_map.get("originalImage", self.data.get("image"))}
-        )
+        if data and "imageItem" in data:
+            img_map = data["imageItem"] or {}
+            data["image"] = img_map.get("originalImage")
+
+        return data
 
     async def _push_entity_state(self, entity, data: dict) -> None:
         """Push state to server."""
         account = entity.coordinator.account
-        auth = await account.api.get_auth()
 
         # Open the door
         if not data.get("is_locked"):
             params = {
-                "clientId": auth.client_id,
+                "clientId": account.api.auth.client_id,
                 "doorId": entity.daoEntity.get("doorId"),
                 "longitude": "",
                 "latitude": "",
@@ -243,11 +513,8 @@ class XiaoTuDevice(BaseDevice):
 
             _LOGGER.info("XiaoTuDevice._push_entity_state: %s", params)
 
-            await account.api.get(
-                "/wap/door/openDoorNew",
-                params=params,
-                headers={"tokenId": auth.token_id},
-            )
+            # The token is added by `XiaoTuAuth`
+            await account.api.get("/wap/door/openDoorNew", params=params)
 
         # Close the door
         # Do nothing
@@ -0,0 +1,69 @@
+"""Diagnostics support for XiaoTu Door."""
+
+from __future__ import annotations
+
+from dataclasses import asdict
+from typing import Any
+
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import CONF_PASSWORD, CONF_USERNAME
+from homeassistant.core import HomeAssistant
+
+from .coordinator import XiaoTuCoordinator
+from .utils import ANONYMIZED_KEYS
+
+TO_REDACT = {
+    *ANONYMIZED_KEYS,
+    CONF_PASSWORD,
+    CONF_USERNAME,
+    "client_id",
+    "token_id",
+    "init_token",
+}
+
+
+async def async_get_config_entry_diagnostics(
+    hass: HomeAssistant, entry: ConfigEntry
+) -> dict[str, Any]:
+    """Return diagnostics for a config entry.
+
+    The captured responses are only anonymized here, when they are dumped.
+    """
+    diagnostics: dict[str, Any] = {
+        "entry": {
+            "data": async_redact_data(entry.data, TO_REDACT),
+            "options": async_redact_data(entry.options, TO_REDACT),
+        },
+    }
+
+    # Not set up, e.g. waiting for a retry of the setup
+    coordinator: XiaoTuCoordinator | None = getattr(entry, "coordinator", None)
+    if coordinator is None:
+        return diagnostics
+
+    account = coordinator.account
+    api = account.api
+
+    return {
+        **diagnostics,
+        "coordinator": {
+            "last_update_success": coordinator.last_update_success,
+            "update_interval": str(coordinator.update_interval),
+            "circuit_breaker": api.circuit_breaker.state,
+            "auth_valid": api.is_auth_valid(),
+            "last_connect_time": api.last_connect_time,
+            "bootstrap_timings": account.bootstrap_timings,
+        },
+        "user": async_redact_data(account.dump_user(), TO_REDACT),
+        "devices": [
+            {
+                "id": device.id,
+                "type": device.type,
+                "entities": async_redact_data(device.dump_entities(), TO_REDACT),
+            }
+            for device in account.devices
+        ],
+        "metrics": api.metrics.as_dict(),
+        "responses": [asdict(response) for response in api.responses.dump()],
+    }
@@ -4,7 +4,8 @@ from __future__ import annotations
 
 import logging
 
-from homeassistant.helpers.device_registry import DeviceInfo
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.helpers.device_registry import DeviceEntryType, DeviceInfo
 from homeassistant.helpers.update_coordinator import CoordinatorEntity
 
 from .const import DOMAIN
@@ -14,6 +15,26 @@ from .dao import DaoEntity, XiaoTuDevice
 _LOGGER = logging.getLogger(__name__)
 
 
+def get_unique_id(daoEntity: DaoEntity) -> str:
+    """Get the unique id of the entity of a DaoEntity."""
+    return f"{DOMAIN}_{daoEntity.type}_{daoEntity.id}"
+
+
+def get_account_device_id(entry: ConfigEntry) -> str:
+    """Get the device id of an account."""
+    return f"account_{entry.entry_id}"
+
+
+def get_account_device_info(entry: ConfigEntry) -> DeviceInfo:
+    """Get the device of the entities of a whole account."""
+    return DeviceInfo(
+        identifiers={(DOMAIN, get_account_device_id(entry))},
+        entry_type=DeviceEntryType.SERVICE,
+        manufacturer="XiaoTu",
+        name=f"XiaoTu {entry.title}",
+    )
+
+
 class BaseEntity(CoordinatorEntity[XiaoTuCoordinator]):
     """Common base for all entities."""
 
@@ -26,13 +47,14 @@ class BaseEntity(CoordinatorEntity[XiaoTuCoordinator]):
         daoEntity: DaoEntity,
     ) -> None:
         """Initialize entity."""
-        super().__init__(coordinator)
+        # The coordinator only notifies the entity when its DaoEntity changed
+        super().__init__(coordinator, context=daoEntity)
 
         self.daoEntity = daoEntity
         self.device = device
 
         self._attr_name = daoEntity.name
-        self._attr_unique_id = f"{DOMAIN}_{daoEntity.type}_{daoEntity.id}"
+        self._attr_unique_id = get_unique_id(daoEntity)
 
         self._attr_device_info = DeviceInfo(
             serial_number=device.serial_number,
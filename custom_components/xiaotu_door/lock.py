@@ -2,14 +2,22 @@
 
 from __future__ import annotations
 
+import asyncio
+from datetime import datetime
 import logging
+import time
+from typing import Any
 
-from homeassistant.components.lock import LockEntity
-from homeassistant.core import HomeAssistant, callback
+from homeassistant.components.lock import DOMAIN as LOCK_DOMAIN, LockEntity
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.helpers import entity_registry as er
+from homeassistant.helpers.event import async_call_later
 
+from .circuit import STATE_OPEN
+from .const import AUTO_RELOCK_DELAY, CONF_CONFIRM_STATE, DOMAIN
 from .coordinator import XiaoTuCoordinator
 from .dao import DaoEntity, XiaoTuDevice
-from .entity import BaseEntity
+from .entity import BaseEntity, get_unique_id
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -18,15 +26,47 @@ async def async_setup_entry(hass: HomeAssistant, config_entry, async_add_entitie
     """Perform the setup for XiaoTu Door devices."""
     coordinator = config_entry.coordinator
 
-    entities = [
-        XiaoTuDoorLock(coordinator, device, daoEntity)
-        for device in coordinator.account.devices
-        if device.type == "village"
-        for daoEntity in await device.get_entities()
-        if daoEntity.type == "lock"
+    devices = [
+        device for device in coordinator.account.devices if device.type == "village"
     ]
+    await asyncio.gather(*(device.get_entities() for device in devices))
 
-    async_add_entities(entities)
+    # Unique ids of the added entities
+    known_ids: set[str] = set()
+
+    @callback
+    def _async_sync_entities() -> None:
+        """Add and remove entities to match the synced door list."""
+        current = {
+            get_unique_id(daoEntity): (device, daoEntity)
+            for device in devices
+            for daoEntity in device.entities
+            if daoEntity.type == "lock"
+        }
+
+        entity_registry = er.async_get(hass)
+        for unique_id in known_ids - current.keys():
+            entity_id = entity_registry.async_get_entity_id(
+                LOCK_DOMAIN, DOMAIN, unique_id
+            )
+            if entity_id:
+                _LOGGER.info("Removing lock %s", entity_id)
+                entity_registry.async_remove(entity_id)
+
+        entities = [
+            XiaoTuDoorLock(coordinator, device, daoEntity)
+            for unique_id, (device, daoEntity) in current.items()
+            if unique_id not in known_ids
+        ]
+
+        known_ids.clear()
+        known_ids.update(current)
+
+        if entities:
+            async_add_entities(entities)
+
+    _async_sync_entities()
+    config_entry.async_on_unload(coordinator.async_add_listener(_async_sync_entities))
 
 
 class XiaoTuDoorLock(BaseEntity, LockEntity):
@@ -44,10 +84,21 @@ class XiaoTuDoorLock(BaseEntity, LockEntity):
         """Initialize the lock."""
         super().__init__(coordinator, device, daoEntity)
 
+        self._relock_unsub: CALLBACK_TYPE | None = None
         self._attr_is_locked = self.get_locked_state()
 
+    async def async_will_remove_from_hass(self) -> None:
+        """When entity will be removed from hass."""
+        self._async_cancel_relock()
+        await super().async_will_remove_from_hass()
+
     def get_locked_state(self) -> bool:
         """Get lock locked state."""
+
+        # An opened door is shown as unlocked until the relock timer fires
+        if self._relock_unsub:
+            return False
+
         return self.daoEntity.get("isOpen", "2") == "2"
 
     async def async_lock(self, **kwargs) -> None:
@@ -57,7 +108,12 @@ class XiaoTuDoorLock(BaseEntity, LockEntity):
         self._attr_is_locking = True
         self.async_write_ha_state()
 
-        await self.device.push_entity_state(self, {"is_locked": True})
+        try:
+            await self.device.push_entity_state(self, {"is_locked": True})
+            self._async_cancel_relock()
+        finally:
+            self.coordinator.async_boost_polling()
+            self._handle_coordinator_update()
 
     async def async_unlock(self, **kwargs) -> None:
         """Unlock the door."""
@@ -66,14 +122,72 @@ class XiaoTuDoorLock(BaseEntity, LockEntity):
         self._attr_is_unlocking = True
         self.async_write_ha_state()
 
-        await self.device.push_entity_state(self, {"is_locked": False})
+        # End-to-end latency, including the login, retries and confirmation
+        started_at = time.monotonic()
+        error: BaseException | None = None
+
+        try:
+            await self.device.push_entity_state(
+                self,
+                {"is_locked": False},
+                confirm=self.coordinator.config_entry.options.get(
+                    CONF_CONFIRM_STATE, False
+                ),
+            )
+            self._async_schedule_relock()
+        except BaseException as err:
+            error = err
+            raise
+        finally:
+            self.device.api.metrics.record_command(
+                "unlock", time.monotonic() - started_at, error
+            )
+            self.coordinator.async_boost_polling()
+            self._handle_coordinator_update()
+
+    @property
+    def extra_state_attributes(self) -> dict[str, Any]:
+        """Return the state attributes."""
+        api = self.device.api
+
+        return {
+            "connect_time": api.last_connect_time,
+            "circuit_breaker": api.circuit_breaker.state,
+        }
+
+    @property
+    def available(self) -> bool:
+        """Return if the door can be used, not while the circuit is open."""
+        return super().available and self.device.api.circuit_breaker.state != STATE_OPEN
+
+    @callback
+    def _async_schedule_relock(self) -> None:
+        """Show the door as locked again after `AUTO_RELOCK_DELAY`."""
+        self._async_cancel_relock()
+        self._relock_unsub = async_call_later(
+            self.hass, AUTO_RELOCK_DELAY, self._async_relock
+        )
+
+    @callback
+    def _async_cancel_relock(self) -> None:
+        """Cancel the pending relock."""
+        if self._relock_unsub:
+            self._relock_unsub()
+            self._relock_unsub = None
+
+    @callback
+    def _async_relock(self, _now: datetime) -> None:
+        """Relock timer fired."""
+        self._relock_unsub = None
+        self._handle_coordinator_update()
 
     @callback
     def _handle_coordinator_update(self) -> None:
         """Handle updated data from the coordinator."""
-        _LOGGER.info("Updating lock data of %s", self.daoEntity.name)
+        _LOGGER.debug("Updating lock data of %s", self.daoEntity.name)
 
         # Update the HA state
+        self._attr_name = self.daoEntity.name
         is_locked = self.get_locked_state()
         if self._attr_is_locked != is_locked:
             self._attr_is_locked = is_locked
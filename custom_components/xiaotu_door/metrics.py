@@ -0,0 +1,175 @@
+"""Request metrics of the XiaoTu API, in bounded memory."""
+
+from __future__ import annotations
+
+from bisect import bisect_left
+from collections import Counter
+import math
+
+import httpx
+
+from .utils import APIError
+
+# Upper bounds of the latency buckets in seconds, from 5ms to 2 minutes
+LATENCY_BUCKETS: tuple[float, ...] = tuple(
+    round(0.005 * 1.25**index, 4)
+    for index in range(math.ceil(math.log(120 / 0.005, 1.25)) + 1)
+)
+
+
+class LatencyHistogram:
+    """Latencies counted in fixed buckets, percentiles are bucket bounds."""
+
+    __slots__ = ("count", "counts", "max", "total")
+
+    def __init__(self) -> None:
+        """Initialize an empty histogram."""
+
+        # The last bucket counts everything above the last bound
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float) -> None:
+        """Count a latency."""
+
+        self.counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, percent: float) -> float | None:
+        """Get the latency below which `percent` of the latencies fall."""
+
+        if not self.count:
+            return None
+
+        rank = math.ceil(self.count * percent / 100)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                break
+
+        if index >= len(LATENCY_BUCKETS):
+            return round(self.max, 4)
+
+        return round(min(LATENCY_BUCKETS[index], self.max), 4)
+
+    def as_dict(self) -> dict[str, float | int | None]:
+        """Get the headline numbers."""
+
+        return {
+            "count": self.count,
+            "mean": round(self.total / self.count, 4) if self.count else None,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "max": round(self.max, 4) if self.count else None,
+        }
+
+
+def get_error_class(err: BaseException) -> str:
+    """Get the class of an error, as counted by the metrics."""
+
+    if isinstance(err, (httpx.TimeoutException, TimeoutError)):
+        return "timeout"
+
+    if isinstance(err, (APIError, httpx.HTTPError)):
+        return type(err).__name__
+
+    return "other"
+
+
+class OperationStats:
+    """Counts, error classes and latencies of an endpoint or a command."""
+
+    __slots__ = ("errors", "latency", "requests")
+
+    def __init__(self) -> None:
+        """Initialize empty stats."""
+
+        self.requests = 0
+        self.errors: Counter[str] = Counter()
+        self.latency = LatencyHistogram()
+
+    def as_dict(self) -> dict:
+        """Get the stats."""
+
+        return {
+            "requests": self.requests,
+            "errors": dict(self.errors),
+            "latency": self.latency.as_dict(),
+        }
+
+
+class APIMetrics:
+    """Metrics of the requests of an API, by endpoint path.
+
+    Latencies are measured from sending a request to receiving its response
+    headers, so they are the time spent by the network and the servers.
+    Requests and errors are counted per attempt, including retries.
+    """
+
+    def __init__(self) -> None:
+        """Initialize the metrics."""
+
+        self.endpoints: dict[str, OperationStats] = {}
+        self.commands: dict[str, OperationStats] = {}
+
+    def _get_stats(self, stats: dict[str, OperationStats], key: str) -> OperationStats:
+        """Get the stats of `key`, created on first use."""
+        if key not in stats:
+            stats[key] = OperationStats()
+
+        return stats[key]
+
+    def record_latency(self, path: str, seconds: float) -> None:
+        """Record the latency of a response."""
+        self._get_stats(self.endpoints, path).latency.add(seconds)
+
+    def record_request(self, path: str, err: BaseException | None = None) -> None:
+        """Count a request to an endpoint, and its error if it failed."""
+
+        stats = self._get_stats(self.endpoints, path)
+        stats.requests += 1
+        if err is not None:
+            stats.errors[get_error_class(err)] += 1
+
+    def record_command(
+        self, action: str, seconds: float, err: BaseException | None = None
+    ) -> None:
+        """Record an end-to-end command, like an unlock."""
+
+        stats = self._get_stats(self.commands, action)
+        stats.requests += 1
+        if err is not None:
+            stats.errors[get_error_class(err)] += 1
+        else:
+            stats.latency.add(seconds)
+
+    def get_endpoint(self, path: str) -> OperationStats | None:
+        """Get the stats of an endpoint."""
+        return self.endpoints.get(path)
+
+    def get_command(self, action: str) -> OperationStats | None:
+        """Get the stats of a command."""
+        return self.commands.get(action)
+
+    @property
+    def error_count(self) -> int:
+        """Get the number of failed requests."""
+        return sum(sum(stats.errors.values()) for stats in self.endpoints.values())
+
+    def as_dict(self) -> dict:
+        """Get all metrics."""
+
+        return {
+            "endpoints": {
+                path: stats.as_dict() for path, stats in self.endpoints.items()
+            },
+            "commands": {
+                action: stats.as_dict() for action, stats in self.commands.items()
+            },
+        }
@@ -0,0 +1,174 @@
+"""Rate limiting, retries and timeouts of the requests to the XiaoTu servers."""
+
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass
+import logging
+import random
+import time
+
+import httpx
+
+from .const import (
+    COMMAND_CONNECT_TIMEOUT,
+    COMMAND_TIMEOUT,
+    LOGIN_TIMEOUT,
+    POLL_CONNECT_TIMEOUT,
+    RATE_LIMIT_COMMAND,
+    RATE_LIMIT_POLL,
+    RETRY_BACKOFF_MAX,
+    RETRY_BACKOFF_MIN,
+)
+from .utils import QuotaError
+
+BUDGET_POLL = "poll"
+BUDGET_COMMAND = "command"
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """A token bucket, refilled with `rate` tokens per second."""
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        """Initialize the bucket, full."""
+
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+
+    def reserve(self) -> float:
+        """Take a token, return the seconds to wait before using it.
+
+        Tokens can be borrowed from the future, so waiting callers are served
+        in order without holding a lock.
+        """
+
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated_at) * self.rate
+        )
+        self._updated_at = now
+        self._tokens -= 1
+
+        wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        return max(wait, self._paused_until - now)
+
+    def pause(self, seconds: float) -> None:
+        """Hold back all tokens for `seconds`, e.g. after a `Retry-After`."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self) -> None:
+        """Wait for a token."""
+
+        if (wait := self.reserve()) > 0:
+            await asyncio.sleep(wait)
+
+
+@dataclass(frozen=True)
+class EndpointPolicy:
+    """How the requests to an endpoint are limited, retried and timed out."""
+
+    budget: str = BUDGET_POLL
+    attempts: int = 3
+    # Retry any `RequestError`, or only errors before the request was sent
+    retry_sent: bool = True
+
+    # Deadline of each attempt and connect timeout, in seconds. Without a
+    # deadline the timeout of the `APIConfiguration` is used.
+    timeout: float | None = None
+    connect_timeout: float = POLL_CONNECT_TIMEOUT
+
+    def should_retry(self, err: Exception) -> bool:
+        """Check if a request failing with `err` can be sent again."""
+
+        if isinstance(err, QuotaError):
+            return True
+
+        if self.retry_sent:
+            return isinstance(err, httpx.RequestError)
+
+        # The door may have opened already, only retry if nothing was sent
+        return isinstance(err, (httpx.ConnectError, httpx.ConnectTimeout))
+
+
+# Polling endpoints, like getDoor and getUserInfoV2
+DEFAULT_POLICY = EndpointPolicy()
+
+# Policies by endpoint path
+ENDPOINT_POLICIES: dict[str, EndpointPolicy] = {
+    "/wap/door/openDoorNew": EndpointPolicy(
+        budget=BUDGET_COMMAND,
+        attempts=2,
+        retry_sent=False,
+        timeout=COMMAND_TIMEOUT,
+        connect_timeout=COMMAND_CONNECT_TIMEOUT,
+    ),
+    # Unlocks wait for the login when the token expired
+    "/userClient/clientV2/loginByOpenId": EndpointPolicy(
+        budget=BUDGET_COMMAND,
+        timeout=LOGIN_TIMEOUT,
+        connect_timeout=COMMAND_CONNECT_TIMEOUT,
+    ),
+}
+
+
+def get_policy(request: httpx.Request) -> EndpointPolicy:
+    """Get the policy of a request."""
+    return ENDPOINT_POLICIES.get(request.url.path, DEFAULT_POLICY)
+
+
+def get_backoff(attempt: int) -> float:
+    """Get the seconds to wait before the retry after `attempt` failures."""
+
+    backoff = min(
+        RETRY_BACKOFF_MIN.total_seconds() * 2 ** (attempt - 1),
+        RETRY_BACKOFF_MAX.total_seconds(),
+    )
+
+    # Equal jitter, keeps some backoff while spreading the retries
+    return backoff / 2 + random.uniform(0, backoff / 2)
+
+
+class RateLimiter:
+    """The request budgets of an account."""
+
+    def __init__(self) -> None:
+        """Initialize the budgets."""
+
+        self.buckets = {
+            BUDGET_POLL: TokenBucket(*RATE_LIMIT_POLL),
+            BUDGET_COMMAND: TokenBucket(*RATE_LIMIT_COMMAND),
+        }
+
+    async def acquire(self, policy: EndpointPolicy) -> None:
+        """Wait for the budget of a request."""
+        await self.buckets[policy.budget].acquire()
+
+    def get_retry_delay(
+        self, policy: EndpointPolicy, attempt: int, err: Exception
+    ) -> float | None:
+        """Get the seconds to wait before retrying a failed request.
+
+        Returns None if the request should not be retried. Quota errors also
+        hold back the background polling, for `Retry-After` if given.
+        """
+
+        delay = get_backoff(attempt)
+
+        if isinstance(err, QuotaError):
+            if err.retry_after is not None:
+                delay = max(delay, err.retry_after)
+
+            self.buckets[BUDGET_POLL].pause(delay)
+
+        if attempt >= policy.attempts or not policy.should_retry(err):
+            return None
+
+        if delay > RETRY_BACKOFF_MAX.total_seconds():
+            return None
+
+        return delay
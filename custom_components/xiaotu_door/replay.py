@@ -0,0 +1,157 @@
+"""Record the traffic of the API, and replay it offline."""
+
+from __future__ import annotations
+
+import asyncio
+from collections import defaultdict, deque
+import json
+import logging
+from pathlib import Path
+import time
+
+import httpx
+
+from .utils import CapturedResponse, anonymize_response, anonymize_url, get_now
+
+# Headers kept with a recorded response
+RECORDED_HEADERS = ("content-type", "retry-after")
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    """Save every request/response pair to `record_dir`, with its timing.
+
+    Each exchange is saved as `<index>_xiaotu<path>.json`, with the same
+    anonymization as the diagnostics, so recordings can be shared.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, record_dir: str) -> None:
+        """Initialize the transport."""
+
+        self._transport = transport
+        self._record_dir = Path(record_dir)
+        self._started_at = time.monotonic()
+        self._index = 0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        """Send the request and record it with its response."""
+
+        sent_at = time.monotonic()
+        response = await self._transport.handle_async_request(request)
+        try:
+            content = await response.aread()
+        finally:
+            await response.aclose()
+        elapsed = time.monotonic() - sent_at
+
+        headers = {
+            key: value
+            for key in RECORDED_HEADERS
+            if (value := response.headers.get(key)) is not None
+        }
+
+        anonymized = anonymize_response(
+            CapturedResponse(
+                url=str(request.url),
+                status_code=response.status_code,
+                content_type=headers.get("content-type", ""),
+                content=content,
+                captured_at=get_now(),
+            )
+        )
+
+        self._index += 1
+        await asyncio.to_thread(
+            self._write,
+            f"{self._index:04d}_{anonymized.filename}",
+            {
+                "method": request.method,
+                "path": request.url.path,
+                "url": anonymize_url(str(request.url)),
+                "status_code": response.status_code,
+                "headers": headers,
+                "content": anonymized.content,
+                "elapsed": round(elapsed, 4),
+                "offset": round(sent_at - self._started_at, 4),
+            },
+        )
+
+        # The content was decoded, do not pass the encoding headers on
+        return httpx.Response(
+            response.status_code,
+            headers=headers,
+            content=content,
+            extensions=response.extensions,
+        )
+
+    def _write(self, filename: str, exchange: dict) -> None:
+        """Write an exchange to the record directory."""
+
+        self._record_dir.mkdir(parents=True, exist_ok=True)
+        (self._record_dir / filename).write_text(
+            json.dumps(exchange, ensure_ascii=False, indent=2), encoding="utf-8"
+        )
+
+    async def aclose(self) -> None:
+        """Close the wrapped transport."""
+        await self._transport.aclose()
+
+
+class ReplayTransport(httpx.AsyncBaseTransport):
+    """Serve the exchanges recorded by `RecordingTransport`, without network.
+
+    Requests are matched by method and path, and get the recorded responses
+    in order. The last response of an endpoint is repeated once all were
+    served, so polling can go on. Responses are served at once, or after the
+    recorded latency divided by `speed`.
+    """
+
+    def __init__(self, replay_dir: str, speed: float | None = None) -> None:
+        """Initialize the transport, the recordings are loaded on first use."""
+
+        self._replay_dir = Path(replay_dir)
+        self._speed = speed
+        self._exchanges: dict[tuple[str, str], deque[dict]] | None = None
+        self._load_lock = asyncio.Lock()
+
+    def _load(self) -> dict[tuple[str, str], deque[dict]]:
+        """Load the recorded exchanges, in recorded order."""
+
+        exchanges: dict[tuple[str, str], deque[dict]] = defaultdict(deque)
+        for path in sorted(self._replay_dir.glob("*.json")):
+            exchange = json.loads(path.read_text(encoding="utf-8"))
+            exchanges[(exchange["method"], exchange["path"])].append(exchange)
+
+        _LOGGER.debug("ReplayTransport.load: %s", list(exchanges))
+
+        return exchanges
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        """Serve the next recorded response of the endpoint."""
+
+        if self._exchanges is None:
+            async with self._load_lock:
+                if self._exchanges is None:
+                    self._exchanges = await asyncio.to_thread(self._load)
+
+        queue = self._exchanges.get((request.method, request.url.path))
+        if not queue:
+            return httpx.Response(
+                404, text=f"No recorded response for {request.url.path}"
+            )
+
+        exchange = queue.popleft() if len(queue) > 1 else queue[0]
+
+        if self._speed:
+            await asyncio.sleep(exchange.get("elapsed", 0) / self._speed)
+
+        content = exchange.get("content")
+        if not isinstance(content, str):
+            content = json.dumps(content, ensure_ascii=False)
+
+        return httpx.Response(
+            exchange["status_code"],
+            headers=exchange.get("headers"),
+            content=content.encode(),
+        )
@@ -0,0 +1,71 @@
+"""Domain wide scheduling of the XiaoTu config entries."""
+
+from __future__ import annotations
+
+import asyncio
+import datetime
+from hashlib import sha256
+import math
+import time
+
+from homeassistant.core import HomeAssistant, callback
+
+from .const import DOMAIN, UPSTREAM_MAX_CONCURRENT
+
+DATA_SCHEDULER = "scheduler"
+
+
+class XiaoTuScheduler:
+    """Spread the work of many config entries over time.
+
+    Every entry gets a fixed slot in each interval, derived from its entry id,
+    so entries set up at the same time do not call the servers in lockstep.
+    The limiter bounds the concurrent polling requests of all entries.
+    """
+
+    def __init__(self, max_concurrent: int = UPSTREAM_MAX_CONCURRENT) -> None:
+        """Initialize the scheduler."""
+
+        self.limiter = asyncio.Semaphore(max_concurrent)
+
+    @staticmethod
+    def get_phase(key: str) -> float:
+        """Get the deterministic phase of `key`, in [0, 1)."""
+
+        digest = sha256(key.encode()).digest()
+        return int.from_bytes(digest[:8], "big") / 2**64
+
+    def get_offset(self, key: str, spread: datetime.timedelta) -> datetime.timedelta:
+        """Get the offset of `key` within `spread`."""
+        return spread * self.get_phase(key)
+
+    def get_next_slot(
+        self, key: str, interval: datetime.timedelta
+    ) -> datetime.timedelta:
+        """Get the delay until the next slot of `key`, for a periodic task.
+
+        Slots are `interval` apart and aligned on the wall clock, with the
+        offset of `key`. The delay is between half and one and a half
+        intervals, so the interval is kept on average.
+        """
+
+        period = interval.total_seconds()
+        if period <= 0:
+            return interval
+
+        offset = self.get_phase(key) * period
+        now = time.time()
+        slot = math.ceil((now + period / 2 - offset) / period) * period + offset
+
+        return datetime.timedelta(seconds=slot - now)
+
+
+@callback
+def async_get_scheduler(hass: HomeAssistant) -> XiaoTuScheduler:
+    """Get the scheduler shared by all config entries."""
+
+    domain_data = hass.data.setdefault(DOMAIN, {})
+    if DATA_SCHEDULER not in domain_data:
+        domain_data[DATA_SCHEDULER] = XiaoTuScheduler()
+
+    return domain_data[DATA_SCHEDULER]
@@ -0,0 +1,162 @@
+"""Diagnostic sensors of the requests to the XiaoTu servers."""
+
+from __future__ import annotations
+
+from collections.abc import Callable
+from dataclasses import dataclass
+import logging
+from typing import Any
+
+from homeassistant.components.sensor import (
+    SensorDeviceClass,
+    SensorEntity,
+    SensorEntityDescription,
+    SensorStateClass,
+)
+from homeassistant.const import EntityCategory, UnitOfTime
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.update_coordinator import CoordinatorEntity
+
+from .const import DOMAIN
+from .coordinator import XiaoTuCoordinator
+from .entity import get_account_device_info
+from .metrics import APIMetrics, OperationStats
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def _get_latency(stats: OperationStats | None) -> float | None:
+    """Get the median latency."""
+    return stats.latency.percentile(50) if stats else None
+
+
+def _get_latency_attributes(stats: OperationStats | None) -> dict[str, Any]:
+    """Get the details of the latency and the errors."""
+
+    if not stats:
+        return {}
+
+    return {**stats.as_dict()["latency"], "errors": dict(stats.errors)}
+
+
+@dataclass(frozen=True, kw_only=True)
+class XiaoTuSensorEntityDescription(SensorEntityDescription):
+    """Describes a sensor of the API metrics."""
+
+    stats_fn: Callable[[APIMetrics], OperationStats | None] | None = None
+    value_fn: Callable[[APIMetrics], float | int | None] | None = None
+    attributes_fn: Callable[[APIMetrics], dict[str, Any]] | None = None
+
+
+def _latency_description(
+    key: str,
+    stats_fn: Callable[[APIMetrics], OperationStats | None],
+    enabled: bool = True,
+) -> XiaoTuSensorEntityDescription:
+    """Describe a median latency sensor."""
+
+    return XiaoTuSensorEntityDescription(
+        key=key,
+        translation_key=key,
+        device_class=SensorDeviceClass.DURATION,
+        state_class=SensorStateClass.MEASUREMENT,
+        native_unit_of_measurement=UnitOfTime.SECONDS,
+        suggested_display_precision=3,
+        entity_registry_enabled_default=enabled,
+        stats_fn=stats_fn,
+    )
+
+
+SENSOR_TYPES: tuple[XiaoTuSensorEntityDescription, ...] = (
+    # Measured from `async_unlock`, including the login, retries and confirmation
+    _latency_description(
+        "unlock_latency", lambda metrics: metrics.get_command("unlock")
+    ),
+    _latency_description(
+        "open_door_latency",
+        lambda metrics: metrics.get_endpoint("/wap/door/openDoorNew"),
+    ),
+    _latency_description(
+        "doors_latency", lambda metrics: metrics.get_endpoint("/wap/door/getDoor")
+    ),
+    _latency_description(
+        "user_info_latency",
+        lambda metrics: metrics.get_endpoint("/userClient/cuserV2/getUserInfoV2"),
+        enabled=False,
+    ),
+    _latency_description(
+        "login_latency",
+        lambda metrics: metrics.get_endpoint("/userClient/clientV2/loginByOpenId"),
+        enabled=False,
+    ),
+    XiaoTuSensorEntityDescription(
+        key="request_errors",
+        translation_key="request_errors",
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        value_fn=lambda metrics: metrics.error_count,
+        attributes_fn=lambda metrics: {
+            path: dict(stats.errors)
+            for path, stats in metrics.endpoints.items()
+            if stats.errors
+        },
+    ),
+)
+
+
+async def async_setup_entry(hass: HomeAssistant, config_entry, async_add_entities):
+    """Set up the diagnostic sensors of a XiaoTu account."""
+    coordinator = config_entry.coordinator
+
+    async_add_entities(
+        XiaoTuMetricsSensor(coordinator, description) for description in SENSOR_TYPES
+    )
+
+
+class XiaoTuMetricsSensor(CoordinatorEntity[XiaoTuCoordinator], SensorEntity):
+    """A headline number of the API metrics, updated with the coordinator."""
+
+    _attr_has_entity_name = True
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+
+    entity_description: XiaoTuSensorEntityDescription
+
+    def __init__(
+        self,
+        coordinator: XiaoTuCoordinator,
+        description: XiaoTuSensorEntityDescription,
+    ) -> None:
+        """Initialize the sensor."""
+        super().__init__(coordinator)
+
+        self.entity_description = description
+        entry = coordinator.config_entry
+
+        self._attr_unique_id = f"{DOMAIN}_{entry.entry_id}_{description.key}"
+        self._attr_device_info = get_account_device_info(entry)
+
+    @property
+    def available(self) -> bool:
+        """Return True, the metrics matter the most when the servers fail."""
+        return True
+
+    @property
+    def native_value(self) -> float | int | None:
+        """Return the value of the sensor."""
+        description = self.entity_description
+        metrics = self.coordinator.account.api.metrics
+
+        if description.stats_fn:
+            return _get_latency(description.stats_fn(metrics))
+
+        return description.value_fn(metrics)
+
+    @property
+    def extra_state_attributes(self) -> dict[str, Any]:
+        """Return the state attributes."""
+        description = self.entity_description
+        metrics = self.coordinator.account.api.metrics
+
+        if description.stats_fn:
+            return _get_latency_attributes(description.stats_fn(metrics))
+
+        return description.attributes_fn(metrics)
@@ -0,0 +1,82 @@
+"""Persistent cache for XiaoTu account data."""
+
+from __future__ import annotations
+
+import datetime
+import logging
+from typing import Any
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.storage import Store
+
+from .const import DOMAIN, STORAGE_SAVE_DELAY, STORAGE_VERSION
+from .utils import get_now
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class XiaoTuStore:
+    """Cache of the token, user info and door list of one config entry.
+
+    Every section is stored with the time it was fetched, so readers can
+    decide if it is still fresh enough to be used.
+    """
+
+    def __init__(self, hass: HomeAssistant, entry_id: str) -> None:
+        """Initialize the store."""
+
+        self._store: Store[dict[str, Any]] = Store(
+            hass, STORAGE_VERSION, f"{DOMAIN}.{entry_id}"
+        )
+        self._data: dict[str, Any] = {}
+
+    async def async_load(self) -> None:
+        """Load the cache from disk."""
+
+        data = await self._store.async_load()
+        self._data = data if isinstance(data, dict) else {}
+
+        _LOGGER.debug("XiaoTuStore.load: %s", list(self._data))
+
+    def get(
+        self, key: str, ttl: datetime.timedelta | None = None
+    ) -> tuple[Any, datetime.datetime] | None:
+        """Get a cached section and the time it was fetched.
+
+        Returns None if the section is missing, malformed or older than `ttl`.
+        """
+
+        section = self._data.get(key)
+        if not section:
+            return None
+
+        try:
+            data = section["data"]
+            fetched_at = datetime.datetime.fromisoformat(section["fetched_at"])
+        except (KeyError, TypeError, ValueError):
+            _LOGGER.warning("Ignoring malformed cache section: %s", key)
+            return None
+
+        if ttl is not None and fetched_at + ttl < get_now():
+            return None
+
+        return data, fetched_at
+
+    @callback
+    def async_set(
+        self, key: str, data: Any, fetched_at: datetime.datetime | None = None
+    ) -> None:
+        """Update a cached section and schedule a save."""
+
+        self._data[key] = {
+            "data": data,
+            "fetched_at": (fetched_at or get_now()).isoformat(),
+        }
+
+        self._store.async_delay_save(lambda: self._data, STORAGE_SAVE_DELAY)
+
+    async def async_remove(self) -> None:
+        """Remove the cache from disk."""
+
+        self._data = {}
+        await self._store.async_remove()
@@ -3,31 +3,95 @@
 from collections import deque
 from dataclasses import dataclass
 import datetime
+import email.utils
 import json
 import logging
 import mimetypes
+import re
+from typing import Any
 
 import httpx
 
+try:
+    # Faster JSON backend, shipped with Home Assistant
+    import orjson
+
+    json_loads = orjson.loads
+
+    def _dumps_sorted(data: Any) -> bytes:
+        return orjson.dumps(data, option=orjson.OPT_SORT_KEYS)
+
+except ImportError:
+    json_loads = json.loads
+
+    def _dumps_sorted(data: Any) -> bytes:
+        return json.dumps(data, sort_keys=True).encode()
+
+
+# Response extensions holding the decoded body
+EXTENSION_JSON = "xiaotu_json"
+EXTENSION_ENVELOPE = "xiaotu_envelope"
+
 _LOGGER = logging.getLogger(__name__)
 
 
+# Keys whose values are redacted from captured responses
+ANONYMIZED_KEYS = frozenset({"tokenId", "clientId", "openid", "mobile", "access_token"})
+REDACTED = "**REDACTED**"
+
+# Values of the keys in text which is not valid JSON, e.g. truncated
+_ANONYMIZE_TEXT_RE = re.compile(
+    rb'("(?:'
+    + b"|".join(key.encode() for key in sorted(ANONYMIZED_KEYS))
+    + rb')"\s*:\s*)"[^"]*(?:"|$)'
+)
+
+
 @dataclass
 class AnonymizedResponse:
     """An anonymized response."""
 
     filename: str
-    content: list | None = None
+    content: list | dict | str | None = None
+    url: str = ""
+    status_code: int = 0
+    captured_at: str = ""
+
+
+@dataclass(slots=True)
+class CapturedResponse:
+    """A response as received, only anonymized when it is dumped."""
+
+    url: str
+    status_code: int
+    content_type: str
+    content: bytes
+    captured_at: datetime.datetime
+
+
+@dataclass
+class ResponseEnvelope:
+    """The envelope of every XiaoTu API response."""
+
+    code: int
+    desc: str
+    result: Any
 
 
 class APIError(Exception):
     """General API error."""
 
     def __init__(
-        self, message: str, *, request: httpx.Request, response: httpx.Response
+        self,
+        message: str,
+        *,
+        request: httpx.Request | None,
+        response: httpx.Response | None,
     ) -> None:
         """Initialize the API error."""
         super().__init__(message)
+        self.request = request
+        self.response = response
 
 
 class AuthError(APIError):
@@ -37,32 +101,172 @@ class AuthError(APIError):
 class QuotaError(APIError):
     """Quota exceeded on API."""
 
+    def __init__(
+        self,
+        message: str,
+        *,
+        request: httpx.Request,
+        response: httpx.Response,
+        retry_after: float | None = None,
+    ) -> None:
+        """Initialize the quota error, `retry_after` is given in seconds."""
+        super().__init__(message, request=request, response=response)
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(APIError):
+    """The servers are failing, requests are not sent until they recover."""
+
+    def __init__(self, message: str, *, request: httpx.Request | None = None) -> None:
+        """Initialize the error."""
+        super().__init__(message, request=request, response=None)
+
+
+def get_retry_after(response: httpx.Response) -> float | None:
+    """Get the seconds to wait from the `Retry-After` header of a response."""
+
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=datetime.UTC)
+
+    return max((retry_at - get_now()).total_seconds(), 0.0)
+
 
-def anonymize_data(json_data: list | dict) -> list | dict:
-    """For replace parts of the logfiles."""
+def decode_json(response: httpx.Response) -> Any:
+    """Parse the JSON body of a response, only once per response.
+
+    The response content must have been read.
+    """
+
+    if EXTENSION_JSON not in response.extensions:
+        response.extensions[EXTENSION_JSON] = json_loads(response.content)
+
+    return response.extensions[EXTENSION_JSON]
+
+
+def get_envelope(response: httpx.Response) -> ResponseEnvelope:
+    """Get the decoded XiaoTu API envelope of a response."""
+
+    envelope = response.extensions.get(EXTENSION_ENVELOPE)
+    if envelope is None:
+        json_data = decode_json(response)
+        envelope = response.extensions[EXTENSION_ENVELOPE] = ResponseEnvelope(
+            code=int(json_data["code"]) or 200,
+            desc=json_data.get("desc", ""),
+            result=json_data.get("result"),
+        )
+
+    return envelope
+
+
+def anonymize_data(json_data: Any) -> Any:
+    """Redact the values of the `ANONYMIZED_KEYS`, at any depth."""
+
+    if isinstance(json_data, dict):
+        return {
+            key: REDACTED if key in ANONYMIZED_KEYS else anonymize_data(value)
+            for key, value in json_data.items()
+        }
+
+    if isinstance(json_data, list):
+        return [anonymize_data(value) for value in json_data]
 
     return json_data
 
 
-def anonymize_response(response: httpx.Response) -> AnonymizedResponse:
+def anonymize_url(url: str) -> str:
+    """Redact the query params of the `ANONYMIZED_KEYS`."""
+
+    parsed = httpx.URL(url)
+    for key in ANONYMIZED_KEYS.intersection(parsed.params):
+        parsed = parsed.copy_set_param(key, REDACTED)
+
+    return str(parsed)
+
+
+def anonymize_response(response: CapturedResponse) -> AnonymizedResponse:
     """Anonymize a responses URL and content."""
     brand = "xiaotu"
 
-    url_parts = response.url.path.split("/")[1:]
+    url_parts = httpx.URL(response.url).path.split("/")[1:]
     url_path = "_".join(url_parts)
 
     try:
         content: list | dict | str
-        content = anonymize_data(response.json())
-    except json.JSONDecodeError:
-        content = response.text
-
-    content_type = next(
-        iter((response.headers.get("content-type") or "").split(";")), ""
+        content = anonymize_data(json_loads(response.content))
+    except ValueError:
+        # Not JSON, or truncated
+        content = _ANONYMIZE_TEXT_RE.sub(
+            rb'\1"' + REDACTED.encode() + rb'"', response.content
+        ).decode(errors="replace")
+
+    content_type = response.content_type.split(";")[0]
+    file_extension = mimetypes.guess_extension(content_type) or ".txt"
+
+    return AnonymizedResponse(
+        f"{brand}{url_path}{file_extension}",
+        content,
+        url=anonymize_url(response.url),
+        status_code=response.status_code,
+        captured_at=response.captured_at.isoformat(),
     )
-    file_extension = mimetypes.guess_extension(content_type or ".txt")
 
-    return AnonymizedResponse(f"{brand}{url_path}{file_extension}", content)
+
+class ResponseCapture:
+    """The last responses of an API, up to `max_bytes` of content.
+
+    Responses are kept as received, so capturing only costs a reference to
+    the content. They are anonymized when dumped.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        """Initialize an empty capture."""
+
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._responses: deque[CapturedResponse] = deque()
+
+    def append(self, response: httpx.Response) -> None:
+        """Capture a response, its content must have been read."""
+
+        content = response.content[: self.max_bytes]
+        self._responses.append(
+            CapturedResponse(
+                url=str(response.url),
+                status_code=response.status_code,
+                content_type=response.headers.get("content-type", ""),
+                content=content,
+                captured_at=get_now(),
+            )
+        )
+        self.size += len(content)
+
+        # Drop the oldest responses, the last one is always kept
+        while self.size > self.max_bytes and len(self._responses) > 1:
+            self.size -= len(self._responses.popleft().content)
+
+    def clear(self) -> None:
+        """Drop all responses."""
+
+        self._responses.clear()
+        self.size = 0
+
+    def dump(self) -> list[AnonymizedResponse]:
+        """Get the anonymized responses, oldest first."""
+        return [anonymize_response(response) for response in self._responses]
 
 
 async def handle_httpstatuserror(
@@ -94,7 +298,7 @@ async def handle_httpstatuserror(
 
     try:
         # Try parsing the known API error JSON
-        _err = ex.response.json()
+        _err = decode_json(ex.response)
         _err_message = f'{type(ex).__name__}: {_err["error"]} - {_err.get("error_description", "")}'
     except (json.JSONDecodeError, KeyError):
         # If format has changed or is not JSON
@@ -102,14 +306,25 @@ async def handle_httpstatuserror(
 
     _logger.log(_level, "%s due to %s", _ex_to_raise.__name__, _err_message)
 
-    if not dont_raise:
-        raise _ex_to_raise(_err_message) from ex
+    if dont_raise:
+        return
+
+    if _ex_to_raise is QuotaError:
+        raise QuotaError(
+            _err_message,
+            request=ex.request,
+            response=ex.response,
+            retry_after=get_retry_after(ex.response),
+        ) from ex
+
+    raise _ex_to_raise(_err_message, request=ex.request, response=ex.response) from ex
+
+
+def get_digest(data: Any) -> int:
+    """Get a digest of JSON data, independent of the order of keys."""
+    return hash(_dumps_sorted(data))
 
 
 def get_now():
     """Get now."""
     return datetime.datetime.now(datetime.UTC)
-
-
-# Cache response content for logging.
-RESPONSE_STORE: list[deque[AnonymizedResponse]] = deque(maxlen=10)
@@ -0,0 +1 @@
+"""Tests for the XiaoTu Door integration."""
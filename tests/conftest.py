@@ -0,0 +1,174 @@
+"""Fixtures for the XiaoTu Door tests."""
+
+from __future__ import annotations
+
+import asyncio
+import base64
+from collections import Counter
+from collections.abc import AsyncGenerator, Generator
+from unittest.mock import patch
+from uuid import uuid4
+
+import httpx
+import pytest
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+from custom_components.xiaotu_door.api import API, TRANSPORT_POOL, APIConfiguration
+from custom_components.xiaotu_door.const import DEFAULT_API_HOST, DOMAIN
+from homeassistant.const import CONF_HOST, CONF_PASSWORD, CONF_USERNAME
+from homeassistant.core import HomeAssistant
+
+pytest_plugins = "pytest_homeassistant_custom_component"
+
+LOGIN_PATH = "/userClient/clientV2/loginByOpenId"
+USER_INFO_PATH = "/userClient/cuserV2/getUserInfoV2"
+DOORS_PATH = "/wap/door/getDoor"
+OPEN_DOOR_PATH = "/wap/door/openDoorNew"
+
+
+def envelope(result=None, code: int = 200, desc: str = "") -> httpx.Response:
+    """Build a XiaoTu API response."""
+    return httpx.Response(200, json={"code": str(code), "desc": desc, "result": result})
+
+
+def get_door(index: int) -> dict:
+    """Build a door record of the door list."""
+    return {
+        "id": f"D{index}",
+        "doorId": f"door{index}",
+        "name": f"Door {index}",
+        "type": "1",
+        "doorType": "door",
+        "status": "0",
+        "isOpen": "2",
+    }
+
+
+class FakeXiaoTuServer:
+    """The XiaoTu servers, answering from memory through `httpx.MockTransport`."""
+
+    def __init__(self, doors: int = 2) -> None:
+        """Initialize the servers."""
+
+        self.requests: Counter[str] = Counter()
+        self.urls: list[httpx.URL] = []
+        self.tokens: set[str] = set()
+        self.doors = [get_door(index) for index in range(doors)]
+        self.opened: list[str] = []
+        # Seconds to wait before answering, by path
+        self.latency: dict[str, float] = {}
+        # HTTP status of the responses, by path, instead of answering
+        self.status: dict[str, int] = {}
+        # Next failures, by path, raised or served before answering
+        self.failures: dict[str, list[Exception | httpx.Response]] = {}
+
+    def expire_tokens(self) -> None:
+        """Expire all tokens, the next requests get code 301."""
+        self.tokens.clear()
+
+    def set_open(self, door_id: str, is_open: bool) -> None:
+        """Set the state of a door reported by the door list."""
+
+        for door in self.doors:
+            if door["doorId"] == door_id:
+                door["isOpen"] = "1" if is_open else "2"
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        """Answer a request."""
+
+        path = request.url.path
+        self.requests[path] += 1
+        self.urls.append(request.url)
+
+        if delay := self.latency.get(path):
+            await asyncio.sleep(delay)
+
+        if status := self.status.get(path):
+            return httpx.Response(status)
+
+        if failures := self.failures.get(path):
+            failure = failures.pop(0)
+            if isinstance(failure, Exception):
+                raise failure
+            return failure
+
+        if path == LOGIN_PATH:
+            token = uuid4().hex
+            self.tokens.add(token)
+            return envelope({"tokenId": token})
+
+        if request.headers.get("tokenId") not in self.tokens:
+            return envelope(code=301, desc="token expired")
+
+        if path == USER_INFO_PATH:
+            return envelope(
+                {
+                    "userId": "U1",
+                    "name": "User",
+                    "mobile": base64.b64encode(b"13800000000").decode(),
+                    "villageId": "V1",
+                    "villageName": "Village",
+                }
+            )
+
+        if path == DOORS_PATH:
+            return envelope([dict(door) for door in self.doors])
+
+        if path == OPEN_DOOR_PATH:
+            door_id = request.url.params["doorId"]
+            self.opened.append(door_id)
+            self.set_open(door_id, True)
+            return envelope()
+
+        return httpx.Response(404)
+
+
+async def setup_entry(
+    hass: HomeAssistant, options: dict | None = None, entry_id: str | None = None
+) -> MockConfigEntry:
+    """Set up a config entry of the fake servers."""
+
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        entry_id=entry_id,
+        data={
+            CONF_HOST: DEFAULT_API_HOST,
+            CONF_USERNAME: "openid",
+            CONF_PASSWORD: "cid",
+        },
+        options=options or {},
+    )
+    entry.add_to_hass(hass)
+
+    assert await hass.config_entries.async_setup(entry.entry_id)
+    await hass.async_block_till_done()
+
+    return entry
+
+
+@pytest.fixture(autouse=True)
+def auto_enable_custom_integrations(enable_custom_integrations):
+    """Enable the custom integrations in all tests."""
+    yield
+
+
+@pytest.fixture
+def xiaotu_server() -> Generator[FakeXiaoTuServer]:
+    """Send the requests of all APIs to a fake XiaoTu server."""
+
+    server = FakeXiaoTuServer()
+    with patch.object(
+        TRANSPORT_POOL,
+        "acquire",
+        side_effect=lambda *args: httpx.MockTransport(server.handle),
+    ):
+        yield server
+
+
+@pytest.fixture
+async def api(xiaotu_server: FakeXiaoTuServer) -> AsyncGenerator[API]:
+    """Get an API client of the fake servers."""
+
+    api = API(APIConfiguration(username="openid", password="cid"))
+    yield api
+    await api.aclose()
@@ -0,0 +1,170 @@
+"""Tests for the XiaoTu API client."""
+
+from __future__ import annotations
+
+import asyncio
+import dataclasses
+import datetime
+from unittest.mock import patch
+
+import httpx
+import pytest
+
+from custom_components.xiaotu_door.account import XiaoTuAccount
+from custom_components.xiaotu_door.api import API, APIConfiguration, TransportPool
+from custom_components.xiaotu_door.const import DEFAULT_API_HOST
+from custom_components.xiaotu_door.ratelimit import ENDPOINT_POLICIES
+from custom_components.xiaotu_door.utils import json_loads
+
+from .conftest import (
+    DOORS_PATH,
+    LOGIN_PATH,
+    OPEN_DOOR_PATH,
+    USER_INFO_PATH,
+    FakeXiaoTuServer,
+)
+from .test_dao import get_lock
+
+
+async def test_concurrent_logins(api: API, xiaotu_server: FakeXiaoTuServer) -> None:
+    """Test concurrent callers share a single login."""
+    xiaotu_server.latency[LOGIN_PATH] = 0.05
+
+    auths = await asyncio.gather(*(api.get_auth() for _ in range(5)))
+
+    assert xiaotu_server.requests[LOGIN_PATH] == 1
+    assert {auth.token_id for auth in auths} == {api.auth.token_id}
+    assert api.auth.token_id in xiaotu_server.tokens
+
+
+async def test_expired_token_replay(api: API, xiaotu_server: FakeXiaoTuServer) -> None:
+    """Test requests failing with code 301 login once and are replayed."""
+    await api.get_auth()
+    expired_token = api.auth.token_id
+    xiaotu_server.expire_tokens()
+    xiaotu_server.latency[DOORS_PATH] = 0.01
+
+    responses = await asyncio.gather(*(api.get(DOORS_PATH) for _ in range(3)))
+
+    assert all(response.json()["code"] == "200" for response in responses)
+    assert xiaotu_server.requests[LOGIN_PATH] == 2
+    # Every request is sent with the expired token, then replayed once
+    assert xiaotu_server.requests[DOORS_PATH] == 6
+    assert api.auth.token_id != expired_token
+
+
+async def test_login_outside_request_deadline(
+    api: API, xiaotu_server: FakeXiaoTuServer, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Test a login for an unlock is not counted in the deadline of the unlock."""
+    monkeypatch.setitem(
+        ENDPOINT_POLICIES,
+        OPEN_DOOR_PATH,
+        dataclasses.replace(ENDPOINT_POLICIES[OPEN_DOOR_PATH], timeout=0.1),
+    )
+    xiaotu_server.latency[LOGIN_PATH] = 0.2
+
+    await api.get_auth()
+    api.auth.fetched_at -= datetime.timedelta(days=1)
+
+    await api.get(OPEN_DOOR_PATH, params={"doorId": "door0"})
+
+    assert xiaotu_server.requests[LOGIN_PATH] == 2
+    assert xiaotu_server.opened == ["door0"]
+
+
+async def test_commands_bypass_shared_limiter() -> None:
+    """Test unlocks do not wait for the polls of other accounts."""
+    limiter = asyncio.Semaphore(1)
+    lease = TransportPool().acquire(APIConfiguration(), limiter)
+    lease._transport = httpx.MockTransport(lambda request: httpx.Response(200))
+
+    async with limiter:
+        response = await asyncio.wait_for(
+            lease.handle_async_request(
+                httpx.Request("GET", f"{DEFAULT_API_HOST}{OPEN_DOOR_PATH}")
+            ),
+            1,
+        )
+        assert response.status_code == 200
+
+        with pytest.raises(TimeoutError):
+            await asyncio.wait_for(
+                lease.handle_async_request(
+                    httpx.Request("GET", f"{DEFAULT_API_HOST}{DOORS_PATH}")
+                ),
+                0.1,
+            )
+
+    await lease.aclose()
+
+
+async def test_token_only_in_door_list_url(
+    xiaotu_server: FakeXiaoTuServer,
+) -> None:
+    """Test the token is only sent as query param to the endpoints expecting it."""
+    account = XiaoTuAccount({"username": "openid", "password": "cid"})
+    await account.bootstrap()
+    await account.devices[0].push_entity_state(
+        get_lock(account, "door0"), {"is_locked": False}
+    )
+    await account.api.aclose()
+
+    token_id = account.api.auth.token_id
+    paths = {url.path: url.params.get("tokenId") for url in xiaotu_server.urls}
+    assert paths == {
+        LOGIN_PATH: None,
+        USER_INFO_PATH: None,
+        DOORS_PATH: token_id,
+        OPEN_DOOR_PATH: None,
+    }
+
+
+async def test_transport_pool_refcount() -> None:
+    """Test a shared transport is closed after the last lease is closed."""
+    pool = TransportPool()
+    config = APIConfiguration()
+
+    with patch.object(httpx.AsyncHTTPTransport, "aclose", autospec=True) as aclose:
+        first = pool.acquire(config)
+        second = pool.acquire(config)
+        other = pool.acquire(APIConfiguration(host="https://other.example.com"))
+        assert first._transport is second._transport
+        assert other._transport is not first._transport
+
+        await first.aclose()
+        await first.aclose()
+        aclose.assert_not_called()
+
+        await second.aclose()
+        aclose.assert_called_once_with(first._transport)
+
+        # A new lease gets a new transport
+        third = pool.acquire(config)
+        assert third._transport is not first._transport
+
+        await other.aclose()
+        await third.aclose()
+        assert aclose.call_count == 3
+
+
+async def test_responses_decoded_once(
+    xiaotu_server: FakeXiaoTuServer,
+) -> None:
+    """Test each response body is parsed once, even when it is captured."""
+    account = XiaoTuAccount({"username": "openid", "password": "cid"})
+    account.api.set_log_responses(True)
+
+    with patch(
+        "custom_components.xiaotu_door.utils.json_loads", wraps=json_loads
+    ) as loads:
+        await account.bootstrap()
+        xiaotu_server.expire_tokens()
+        await account.bootstrap(sync_entities=True)
+
+    await account.api.aclose()
+
+    # The second door list is answered with code 301, replayed after a login
+    assert xiaotu_server.requests.total() == 6
+    assert loads.call_count == 6
+    assert len(account.api.responses.dump()) == 6
@@ -0,0 +1,54 @@
+"""Tests for the circuit breaker."""
+
+from __future__ import annotations
+
+import pytest
+
+from custom_components.xiaotu_door.circuit import (
+    STATE_CLOSED,
+    STATE_HALF_OPEN,
+    STATE_OPEN,
+    CircuitBreaker,
+)
+from custom_components.xiaotu_door.utils import CircuitOpenError
+
+
+async def test_circuit_breaker() -> None:
+    """Test the circuit opens on failures and a single probe closes it."""
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=60)
+    states: list[str] = []
+    breaker.add_listener(states.append)
+
+    breaker.record(False)
+    assert breaker.state == STATE_CLOSED
+    breaker.record(False)
+    assert breaker.state == STATE_OPEN
+
+    with pytest.raises(CircuitOpenError):
+        breaker.acquire()
+
+    # Cooldown over
+    breaker._opened_at -= 60
+    assert breaker.state == STATE_HALF_OPEN
+    assert breaker.acquire() is True
+    with pytest.raises(CircuitOpenError):
+        breaker.acquire()
+
+    breaker.record(True, probe=True)
+    assert breaker.state == STATE_CLOSED
+    assert breaker.acquire() is False
+    assert states == [STATE_OPEN, STATE_HALF_OPEN, STATE_CLOSED]
+
+
+async def test_failed_probe_opens_circuit() -> None:
+    """Test a failed probe opens the circuit for another cooldown."""
+    breaker = CircuitBreaker(failure_threshold=5, cooldown=60)
+    for _ in range(5):
+        breaker.record(False)
+
+    breaker._opened_at -= 60
+    assert breaker.acquire() is True
+    breaker.record(False, probe=True)
+
+    assert breaker.state == STATE_OPEN
+    assert breaker.retry_in > 59
@@ -0,0 +1,56 @@
+"""Tests for the XiaoTu coordinator."""
+
+from __future__ import annotations
+
+from custom_components.xiaotu_door.const import (
+    AUTH_REFRESH_BACKOFF_MAX,
+    CONF_PREWARM_ENTITIES,
+)
+from homeassistant.const import STATE_HOME, STATE_NOT_HOME
+from homeassistant.core import HomeAssistant
+from homeassistant.util import dt as dt_util
+
+from .conftest import LOGIN_PATH, FakeXiaoTuServer, setup_entry
+
+PERSON = "person.someone"
+
+
+async def test_presence_boosts_polling_on_arrival(
+    hass: HomeAssistant, xiaotu_server: FakeXiaoTuServer
+) -> None:
+    """Test polling is boosted when someone arrives, not on attribute updates."""
+    hass.states.async_set(PERSON, STATE_NOT_HOME)
+    entry = await setup_entry(hass, {CONF_PREWARM_ENTITIES: [PERSON]})
+    coordinator = entry.coordinator
+    assert coordinator._active_until is None
+
+    hass.states.async_set(PERSON, STATE_HOME)
+    await hass.async_block_till_done()
+    active_until = coordinator._active_until
+    assert active_until is not None
+
+    hass.states.async_set(PERSON, STATE_HOME, {"gps_accuracy": 10})
+    await hass.async_block_till_done()
+    assert coordinator._active_until == active_until
+
+    assert await hass.config_entries.async_unload(entry.entry_id)
+
+
+async def test_auth_refresh_backoff_capped(
+    hass: HomeAssistant, xiaotu_server: FakeXiaoTuServer
+) -> None:
+    """Test the token renewal is rescheduled after many failures."""
+    entry = await setup_entry(hass)
+    coordinator = entry.coordinator
+    api = coordinator.account.api
+
+    xiaotu_server.status[LOGIN_PATH] = 500
+    api.auth.fetched_at -= AUTH_REFRESH_BACKOFF_MAX * 100
+    coordinator._auth_refresh_failures = 100
+
+    await coordinator._handle_auth_refresh(dt_util.utcnow())
+
+    assert xiaotu_server.requests[LOGIN_PATH] == 2
+    assert coordinator._auth_refresh_unsub is not None
+
+    assert await hass.config_entries.async_unload(entry.entry_id)
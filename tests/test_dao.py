@@ -0,0 +1,176 @@
+"""Tests for the XiaoTu DAO."""
+
+from __future__ import annotations
+
+import asyncio
+from collections.abc import AsyncGenerator
+from types import SimpleNamespace
+
+import pytest
+
+from custom_components.xiaotu_door.account import XiaoTuAccount
+from custom_components.xiaotu_door.dao import (
+    CommandDispatcher,
+    DaoEntity,
+    XiaoTuDevice,
+)
+
+from .conftest import (
+    DOORS_PATH,
+    LOGIN_PATH,
+    USER_INFO_PATH,
+    FakeXiaoTuServer,
+    get_door,
+)
+
+
+@pytest.fixture
+async def account(xiaotu_server: FakeXiaoTuServer) -> AsyncGenerator[XiaoTuAccount]:
+    """Get a bootstrapped account of the fake servers."""
+
+    account = XiaoTuAccount({"username": "openid", "password": "cid"})
+    await account.bootstrap()
+    yield account
+    await account.api.aclose()
+
+
+async def test_bootstrap_concurrent(xiaotu_server: FakeXiaoTuServer) -> None:
+    """Test the user info and the door list are fetched together after the login."""
+    xiaotu_server.latency[LOGIN_PATH] = 0.05
+    xiaotu_server.latency[USER_INFO_PATH] = 0.1
+    xiaotu_server.latency[DOORS_PATH] = 0.1
+    account = XiaoTuAccount({"username": "openid", "password": "cid"})
+
+    devices = await account.bootstrap()
+    await account.api.aclose()
+
+    assert [device.id for device in devices] == ["V1"]
+    assert len(devices[0].entities) == 2
+    assert xiaotu_server.requests[DOORS_PATH] == 1
+
+    timings = account.bootstrap_timings
+    assert set(timings) == {"auth", "user", "doors", "entities", "total"}
+    assert timings["auth"] >= 0.05
+    assert timings["user"] >= 0.1
+    assert timings["doors"] >= 0.1
+    # Not the sum of the round trips
+    assert timings["total"] < 0.05 + 0.1 + 0.1
+
+
+def get_lock(account: XiaoTuAccount, door_id: str) -> SimpleNamespace:
+    """Get a stand-in of the lock entity of a door."""
+
+    device = account.devices[0]
+    dao_entity = next(entity for entity in device.entities if entity.doorId == door_id)
+    return SimpleNamespace(
+        daoEntity=dao_entity, coordinator=SimpleNamespace(account=account)
+    )
+
+
+async def test_repeated_unlocks_coalesced(
+    account: XiaoTuAccount, xiaotu_server: FakeXiaoTuServer
+) -> None:
+    """Test repeated unlocks of a door are sent once, other doors still are."""
+    device = account.devices[0]
+    lock = get_lock(account, "door0")
+
+    await asyncio.gather(
+        *(device.push_entity_state(lock, {"is_locked": False}) for _ in range(3))
+    )
+    # Within the coalescing window
+    await device.push_entity_state(lock, {"is_locked": False})
+    await device.push_entity_state(get_lock(account, "door1"), {"is_locked": False})
+
+    assert xiaotu_server.opened == ["door0", "door1"]
+
+
+def test_dao_entity() -> None:
+    """Test only the FIELDS are kept, and the version counts the changes."""
+    record = {**get_door(0), "imageItem": {"originalImage": "url"}, "extra": "1"}
+
+    entity = DaoEntity(record)
+    assert entity.as_dict() == get_door(0)
+    assert entity.get("extra") == ""
+    assert entity.version == 1
+    assert not hasattr(entity, "__dict__")
+
+    # Round trip, as done by the cache
+    restored = DaoEntity(entity.as_dict())
+    assert restored.as_dict() == entity.as_dict()
+
+    entity.update(get_door(0))
+    assert entity.version == 1
+    entity.update({"isOpen": "1"})
+    assert entity.version == 2
+    assert entity.get("isOpen") == "1"
+
+    # With the extras, for the fields a release does not know yet
+    entity = DaoEntity(record, keep_extras=True)
+    assert entity.as_dict() == record
+    assert entity.get("extra") == "1"
+    assert DaoEntity(entity.as_dict(), keep_extras=True).as_dict() == record
+
+    entity.update({"extra": "1"})
+    assert entity.version == 1
+    entity.update({"extra": "2"})
+    assert entity.version == 2
+
+
+async def test_dispatcher_runs_other_actions() -> None:
+    """Test only equal commands are joined, in call order for a door."""
+    dispatcher = CommandDispatcher(coalesce_window=0)
+    calls: list[str] = []
+
+    def command(action: str):
+        async def run() -> None:
+            await asyncio.sleep(0.01)
+            calls.append(action)
+
+        return run
+
+    await asyncio.gather(
+        dispatcher.dispatch("door0", "unlock", command("unlock")),
+        dispatcher.dispatch("door0", "unlock", command("unlock")),
+        dispatcher.dispatch("door0", "lock", command("lock")),
+    )
+    await dispatcher.dispatch("door0", "unlock", command("unlock"))
+
+    assert calls == ["unlock", "lock", "unlock"]
+
+
+async def test_sync_entities() -> None:
+    """Test only added, changed and removed records are applied."""
+    device = XiaoTuDevice(SimpleNamespace(), {"id": "V1", "type": "village"})
+
+    changes = device.sync_entities([get_door(0), get_door(1)])
+    assert len(changes.added) == 2
+
+    assert not device.sync_entities([get_door(0), get_door(1)])
+
+    changed = {**get_door(1), "isOpen": "1"}
+    changes = device.sync_entities([get_door(0), changed, get_door(2)])
+    assert [entity.id for entity in changes.changed] == ["D1"]
+    assert [entity.id for entity in changes.added] == ["D2"]
+    assert device.get_entity("d1").isOpen == "1"
+
+    changes = device.sync_entities([get_door(2)])
+    assert {entity.id for entity in changes.removed} == {"D0", "D1"}
+    assert device.get_entity("D0") is None
+
+
+async def test_sync_after_refresh_entity(
+    account: XiaoTuAccount, xiaotu_server: FakeXiaoTuServer
+) -> None:
+    """Test a sync applies the record after an entity was refreshed on its own."""
+    device = account.devices[0]
+    entity = device.get_entity("D0")
+
+    xiaotu_server.set_open("door0", True)
+    await device.refresh_entity(entity)
+    assert entity.isOpen == "1"
+
+    xiaotu_server.set_open("door0", False)
+    await device.get_entities(doors=await account.get_doors())
+
+    assert entity.isOpen == "2"
+    assert xiaotu_server.requests[DOORS_PATH] == 3
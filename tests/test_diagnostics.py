@@ -0,0 +1,102 @@
+"""Tests for the XiaoTu Door diagnostics."""
+
+from __future__ import annotations
+
+import base64
+import datetime
+import json
+
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+from custom_components.xiaotu_door.const import DOMAIN
+from custom_components.xiaotu_door.diagnostics import (
+    TO_REDACT,
+    async_get_config_entry_diagnostics,
+)
+from custom_components.xiaotu_door.utils import (
+    REDACTED,
+    CapturedResponse,
+    anonymize_data,
+    anonymize_response,
+    anonymize_url,
+)
+from homeassistant.core import HomeAssistant
+
+from .conftest import FakeXiaoTuServer, setup_entry
+
+MOBILE = "13800000000"
+
+
+def test_anonymize() -> None:
+    """Test the tokens, ids and mobile are stripped from data and URLs."""
+    data = {
+        "tokenId": "token",
+        "result": [{"clientId": "cid", "openid": "openid", "mobile": MOBILE}],
+        "name": "User",
+    }
+    assert anonymize_data(data) == {
+        "tokenId": REDACTED,
+        "result": [{"clientId": REDACTED, "openid": REDACTED, "mobile": REDACTED}],
+        "name": "User",
+    }
+    assert {"tokenId", "clientId", "openid", "mobile"} <= TO_REDACT
+
+    url = anonymize_url("https://host/path?tokenId=token&openid=openid&doorId=D1")
+    assert "tokenId=token" not in url
+    assert "openid=openid" not in url
+    assert "doorId=D1" in url
+
+    # Truncated JSON is redacted as text
+    response = anonymize_response(
+        CapturedResponse(
+            url="https://host/getUserInfoV2?tokenId=token",
+            status_code=200,
+            content_type="application/json",
+            content=f'{{"tokenId": "token", "mobile": "{MOBILE}", "na'.encode(),
+            captured_at=datetime.datetime.now(datetime.UTC),
+        )
+    )
+    assert "tokenId=token" not in response.url
+    assert MOBILE not in response.content
+    assert '"tokenId": "token"' not in response.content
+
+
+async def test_diagnostics(
+    hass: HomeAssistant, xiaotu_server: FakeXiaoTuServer
+) -> None:
+    """Test the diagnostics keep no token, ids or mobile of the account."""
+    entry = await setup_entry(hass)
+    api = entry.coordinator.account.api
+    api.set_log_responses(True)
+    xiaotu_server.expire_tokens()
+    await entry.coordinator.async_refresh()
+
+    diagnostics = await async_get_config_entry_diagnostics(hass, entry)
+
+    assert diagnostics["responses"]
+    dumped = json.dumps(diagnostics)
+    for secret in (
+        api.auth.token_id,
+        "openid",
+        "cid",
+        MOBILE,
+        base64.b64encode(MOBILE.encode()).decode(),
+    ):
+        assert secret not in dumped
+
+    assert await hass.config_entries.async_unload(entry.entry_id)
+
+
+async def test_diagnostics_not_set_up(hass: HomeAssistant) -> None:
+    """Test the diagnostics of an entry which is not set up."""
+    entry = MockConfigEntry(
+        domain=DOMAIN, data={"username": "openid", "password": "cid"}
+    )
+    entry.add_to_hass(hass)
+
+    assert await async_get_config_entry_diagnostics(hass, entry) == {
+        "entry": {
+            "data": {"username": REDACTED, "password": REDACTED},
+            "options": {},
+        },
+    }
@@ -0,0 +1,202 @@
+"""Tests for the setup of the XiaoTu Door config entries."""
+
+from __future__ import annotations
+
+import datetime
+from typing import Any
+from unittest.mock import patch
+
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+from custom_components.xiaotu_door.const import (
+    DEFAULT_API_HOST,
+    DOMAIN,
+    STORAGE_DOORS_TTL,
+    STORAGE_USER_TTL,
+    STORAGE_VERSION,
+)
+from homeassistant.config_entries import ConfigEntryState
+from homeassistant.const import (
+    CONF_HOST,
+    CONF_PASSWORD,
+    CONF_USERNAME,
+    STATE_LOCKED,
+    STATE_UNAVAILABLE,
+)
+from homeassistant.core import HomeAssistant
+from homeassistant.util import dt as dt_util
+
+from .conftest import DOORS_PATH, LOGIN_PATH, FakeXiaoTuServer, get_door, setup_entry
+from .test_lock import get_lock_ids
+
+ENTRY_ID = "cached_entry"
+
+
+def set_cache(
+    hass_storage: dict[str, Any], age: datetime.timedelta, token: str = "cached"
+) -> None:
+    """Store a cache of the token, the user and two doors, fetched `age` ago."""
+
+    fetched_at = (dt_util.utcnow() - age).isoformat()
+    hass_storage[f"{DOMAIN}.{ENTRY_ID}"] = {
+        "version": STORAGE_VERSION,
+        "minor_version": 1,
+        "key": f"{DOMAIN}.{ENTRY_ID}",
+        "data": {
+            "token": {"data": {"token_id": token}, "fetched_at": fetched_at},
+            "user": {
+                "data": {
+                    "userId": "U1",
+                    "name": "User",
+                    "mobile": "13800000000",
+                    "villageId": "V1",
+                    "villageName": "Village",
+                },
+                "fetched_at": fetched_at,
+            },
+            "doors": {
+                "data": {
+                    "V1": [
+                        {**get_door(index), "_type": "1", "type": "lock"}
+                        for index in range(2)
+                    ]
+                },
+                "fetched_at": fetched_at,
+            },
+        },
+    }
+
+
+async def test_setup_from_fresh_cache(
+    hass: HomeAssistant,
+    hass_storage: dict[str, Any],
+    xiaotu_server: FakeXiaoTuServer,
+) -> None:
+    """Test a fresh cache sets up available locks without calling the servers."""
+    set_cache(hass_storage, datetime.timedelta(minutes=1))
+
+    entry = await setup_entry(hass, entry_id=ENTRY_ID)
+
+    lock_ids = get_lock_ids(hass, entry)
+    assert len(lock_ids) == 2
+    assert all(hass.states.get(lock_id).state == STATE_LOCKED for lock_id in lock_ids)
+    assert not xiaotu_server.requests
+
+    assert await hass.config_entries.async_unload(entry.entry_id)
+
+
+async def test_setup_from_stale_cache(
+    hass: HomeAssistant,
+    hass_storage: dict[str, Any],
+    xiaotu_server: FakeXiaoTuServer,
+) -> None:
+    """Test a stale cache sets up unavailable locks, until revalidated."""
+    set_cache(hass_storage, STORAGE_USER_TTL + STORAGE_DOORS_TTL)
+    xiaotu_server.latency[DOORS_PATH] = 0.05
+
+    entry = await setup_entry(hass, entry_id=ENTRY_ID)
+
+    lock_ids = get_lock_ids(hass, entry)
+    assert len(lock_ids) == 2
+    assert all(
+        hass.states.get(lock_id).state == STATE_UNAVAILABLE for lock_id in lock_ids
+    )
+
+    await hass.async_block_till_done(wait_background_tasks=True)
+
+    assert all(hass.states.get(lock_id).state == STATE_LOCKED for lock_id in lock_ids)
+    assert xiaotu_server.requests[LOGIN_PATH] == 1
+    assert xiaotu_server.requests[DOORS_PATH] == 1
+
+    assert await hass.config_entries.async_unload(entry.entry_id)
+
+
+async def test_setup_without_cache(
+    hass: HomeAssistant, xiaotu_server: FakeXiaoTuServer
+) -> None:
+    """Test a missing cache falls back to a first refresh."""
+    entry = await setup_entry(hass, entry_id=ENTRY_ID)
+
+    assert len(get_lock_ids(hass, entry)) == 2
+    assert xiaotu_server.requests[DOORS_PATH] == 1
+
+    assert await hass.config_entries.async_unload(entry.entry_id)
+
+
+async def test_setup_from_corrupt_cache(
+    hass: HomeAssistant,
+    hass_storage: dict[str, Any],
+    xiaotu_server: FakeXiaoTuServer,
+) -> None:
+    """Test a malformed cache falls back to a first refresh."""
+    set_cache(hass_storage, datetime.timedelta(minutes=1))
+    cache = hass_storage[f"{DOMAIN}.{ENTRY_ID}"]["data"]
+    cache["user"]["fetched_at"] = "yesterday"
+    cache["doors"] = ["garbage"]
+
+    entry = await setup_entry(hass, entry_id=ENTRY_ID)
+
+    assert entry.state is ConfigEntryState.LOADED
+    assert len(get_lock_ids(hass, entry)) == 2
+    assert xiaotu_server.requests[DOORS_PATH] == 1
+
+    assert await hass.config_entries.async_unload(entry.entry_id)
+
+
+async def test_setup_timeout(
+    hass: HomeAssistant, xiaotu_server: FakeXiaoTuServer
+) -> None:
+    """Test a first refresh slower than SETUP_TIMEOUT retries the setup later."""
+    xiaotu_server.latency[LOGIN_PATH] = 1
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={
+            CONF_HOST: DEFAULT_API_HOST,
+            CONF_USERNAME: "openid",
+            CONF_PASSWORD: "cid",
+        },
+    )
+    entry.add_to_hass(hass)
+
+    with patch(
+        "custom_components.xiaotu_door.SETUP_TIMEOUT",
+        datetime.timedelta(seconds=0.05),
+    ):
+        assert not await hass.config_entries.async_setup(entry.entry_id)
+
+    assert entry.state is ConfigEntryState.SETUP_RETRY
+
+
+async def test_cache_saved_on_change(
+    hass: HomeAssistant, xiaotu_server: FakeXiaoTuServer
+) -> None:
+    """Test the cache is only saved when the token, user or doors changed."""
+    entry = await setup_entry(hass)
+    coordinator = entry.coordinator
+
+    with patch.object(coordinator.store, "async_set") as async_set:
+        await coordinator.async_refresh()
+        async_set.assert_not_called()
+
+        xiaotu_server.set_open("door0", True)
+        await coordinator.async_refresh()
+        assert [call.args[0] for call in async_set.call_args_list] == ["doors"]
+
+        async_set.reset_mock()
+        xiaotu_server.expire_tokens()
+        await coordinator.async_refresh()
+        assert [call.args[0] for call in async_set.call_args_list] == ["token"]
+
+    assert await hass.config_entries.async_unload(entry.entry_id)
+
+
+async def test_unload_closes_api(
+    hass: HomeAssistant, xiaotu_server: FakeXiaoTuServer
+) -> None:
+    """Test unloading an entry shuts its coordinator down."""
+    entry = await setup_entry(hass)
+    api = entry.coordinator.account.api
+
+    assert await hass.config_entries.async_unload(entry.entry_id)
+
+    assert api.is_closed
@@ -0,0 +1,101 @@
+"""Tests for the XiaoTu Door locks."""
+
+from __future__ import annotations
+
+from unittest.mock import patch
+
+from pytest_homeassistant_custom_component.common import (
+    MockConfigEntry,
+    async_fire_time_changed,
+)
+
+from custom_components.xiaotu_door.const import AUTO_RELOCK_DELAY, CONF_CONFIRM_STATE
+from custom_components.xiaotu_door.lock import XiaoTuDoorLock
+from homeassistant.const import STATE_LOCKED, STATE_UNLOCKED
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers import entity_registry as er
+from homeassistant.util import dt as dt_util
+
+from .conftest import LOGIN_PATH, FakeXiaoTuServer, setup_entry
+
+
+def get_lock_ids(hass: HomeAssistant, entry: MockConfigEntry) -> list[str]:
+    """Get the lock entities of a config entry, by door."""
+
+    registry = er.async_get(hass)
+    return sorted(
+        (
+            item.entity_id
+            for item in er.async_entries_for_config_entry(registry, entry.entry_id)
+            if item.domain == "lock"
+        ),
+        key=lambda entity_id: registry.async_get(entity_id).unique_id,
+    )
+
+
+async def test_unlock(hass: HomeAssistant, xiaotu_server: FakeXiaoTuServer) -> None:
+    """Test a door unlocks, and shows as locked again after the relock delay."""
+    entry = await setup_entry(hass)
+    lock_ids = get_lock_ids(hass, entry)
+    assert len(lock_ids) == 2
+    assert hass.states.get(lock_ids[0]).state == STATE_LOCKED
+
+    await hass.services.async_call(
+        "lock", "unlock", {"entity_id": lock_ids[0]}, blocking=True
+    )
+
+    assert xiaotu_server.opened == ["door0"]
+    assert xiaotu_server.requests[LOGIN_PATH] == 1
+    assert hass.states.get(lock_ids[0]).state == STATE_UNLOCKED
+
+    async_fire_time_changed(hass, dt_util.utcnow() + AUTO_RELOCK_DELAY)
+    await hass.async_block_till_done()
+    assert hass.states.get(lock_ids[0]).state == STATE_LOCKED
+
+    assert await hass.config_entries.async_unload(entry.entry_id)
+
+
+async def test_confirmed_unlock_relocks(
+    hass: HomeAssistant, xiaotu_server: FakeXiaoTuServer
+) -> None:
+    """Test a confirmed unlock does not keep the door unlocked after a sync."""
+    entry = await setup_entry(hass, {CONF_CONFIRM_STATE: True})
+    lock_id = get_lock_ids(hass, entry)[0]
+
+    await hass.services.async_call(
+        "lock", "unlock", {"entity_id": lock_id}, blocking=True
+    )
+    assert hass.states.get(lock_id).state == STATE_UNLOCKED
+
+    # The door closes, then the relock delay ends and the doors are synced
+    xiaotu_server.set_open("door0", False)
+    async_fire_time_changed(hass, dt_util.utcnow() + AUTO_RELOCK_DELAY)
+    await entry.coordinator.async_refresh()
+    await hass.async_block_till_done()
+
+    assert hass.states.get(lock_id).state == STATE_LOCKED
+
+    assert await hass.config_entries.async_unload(entry.entry_id)
+
+
+async def test_only_changed_lock_written(
+    hass: HomeAssistant, xiaotu_server: FakeXiaoTuServer
+) -> None:
+    """Test a sync only writes the state of the locks whose door changed."""
+    entry = await setup_entry(hass)
+    lock_ids = get_lock_ids(hass, entry)
+
+    with patch.object(
+        XiaoTuDoorLock, "async_write_ha_state", autospec=True
+    ) as async_write_ha_state:
+        await entry.coordinator.async_refresh()
+        async_write_ha_state.assert_not_called()
+
+        xiaotu_server.set_open("door1", True)
+        await entry.coordinator.async_refresh()
+
+    assert [call.args[0].entity_id for call in async_write_ha_state.call_args_list] == [
+        lock_ids[1]
+    ]
+
+    assert await hass.config_entries.async_unload(entry.entry_id)
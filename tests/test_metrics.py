@@ -0,0 +1,112 @@
+"""Tests for the request metrics and their sensors."""
+
+from __future__ import annotations
+
+import httpx
+import pytest
+
+from custom_components.xiaotu_door.metrics import (
+    LATENCY_BUCKETS,
+    APIMetrics,
+    LatencyHistogram,
+)
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers import entity_registry as er
+
+from .conftest import DOORS_PATH, FakeXiaoTuServer, setup_entry
+
+
+def test_latency_buckets() -> None:
+    """Test the buckets grow by 25% from 5ms, up to 2 minutes."""
+    assert LATENCY_BUCKETS[0] == 0.005
+    assert LATENCY_BUCKETS[1] == 0.0063
+    assert LATENCY_BUCKETS[-2] < 120 <= LATENCY_BUCKETS[-1]
+    assert list(LATENCY_BUCKETS) == sorted(LATENCY_BUCKETS)
+
+
+def test_latency_histogram() -> None:
+    """Test the percentiles are bucket bounds, capped by the max latency."""
+    histogram = LatencyHistogram()
+    assert histogram.as_dict() == {
+        "count": 0,
+        "mean": None,
+        "p50": None,
+        "p95": None,
+        "p99": None,
+        "max": None,
+    }
+
+    # A latency on a bound is counted in that bucket
+    for _ in range(9):
+        histogram.add(0.005)
+    histogram.add(0.1)
+
+    assert histogram.counts[0] == 9
+    assert histogram.percentile(50) == 0.005
+    assert histogram.percentile(95) == 0.1
+    assert histogram.as_dict() == {
+        "count": 10,
+        "mean": 0.0145,
+        "p50": 0.005,
+        "p95": 0.1,
+        "p99": 0.1,
+        "max": 0.1,
+    }
+
+    # Above the last bound
+    histogram.add(600)
+    assert histogram.counts[-1] == 1
+    assert histogram.percentile(100) == 600
+
+
+def test_api_metrics() -> None:
+    """Test requests and error classes are counted by endpoint."""
+    metrics = APIMetrics()
+    request = httpx.Request("GET", "https://host/path")
+
+    metrics.record_request("/path")
+    metrics.record_request("/path", httpx.ReadTimeout("slow", request=request))
+    metrics.record_request("/path", httpx.ConnectError("refused", request=request))
+    metrics.record_request("/path", ValueError())
+    metrics.record_command("unlock", 0.2)
+    metrics.record_command("unlock", 5, TimeoutError())
+
+    assert metrics.error_count == 3
+    assert metrics.as_dict()["endpoints"]["/path"]["errors"] == {
+        "timeout": 1,
+        "ConnectError": 1,
+        "other": 1,
+    }
+    unlock = metrics.get_command("unlock")
+    assert unlock.requests == 2
+    assert unlock.latency.count == 1
+
+
+async def test_sensors(hass: HomeAssistant, xiaotu_server: FakeXiaoTuServer) -> None:
+    """Test the sensors show the median latency and the request errors."""
+    xiaotu_server.latency[DOORS_PATH] = 0.05
+    entry = await setup_entry(hass)
+
+    registry = er.async_get(hass)
+    sensor_ids = {
+        item.translation_key: item.entity_id
+        for item in er.async_entries_for_config_entry(registry, entry.entry_id)
+        if item.domain == "sensor"
+    }
+
+    state = hass.states.get(sensor_ids["doors_latency"])
+    assert float(state.state) == pytest.approx(0.05, abs=0.02)
+    assert state.attributes["count"] == 1
+    assert hass.states.get(sensor_ids["request_errors"]).state == "0"
+    # Disabled by default
+    assert hass.states.get(sensor_ids["login_latency"]) is None
+
+    xiaotu_server.status[DOORS_PATH] = 500
+    await entry.coordinator.async_refresh()
+    await hass.async_block_till_done()
+
+    state = hass.states.get(sensor_ids["request_errors"])
+    assert state.state == "1"
+    assert state.attributes[DOORS_PATH] == {"APIError": 1}
+
+    assert await hass.config_entries.async_unload(entry.entry_id)
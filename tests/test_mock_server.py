@@ -0,0 +1,85 @@
+"""Tests for the mock XiaoTu servers of the benchmarks."""
+
+from __future__ import annotations
+
+from collections.abc import AsyncGenerator, Callable
+
+import httpx
+import pytest
+
+from benchmarks.mock_server import (
+    DOORS_PATH,
+    LOGIN_PATH,
+    MockConfig,
+    MockXiaoTuServer,
+)
+
+
+@pytest.fixture
+async def start_server(socket_enabled: None) -> AsyncGenerator[Callable]:
+    """Start mock servers with a configuration, on localhost."""
+
+    servers: list[MockXiaoTuServer] = []
+
+    async def start(config: MockConfig) -> MockXiaoTuServer:
+        server = MockXiaoTuServer(config)
+        await server.start()
+        servers.append(server)
+        return server
+
+    yield start
+
+    for server in servers:
+        await server.stop()
+
+
+async def login(client: httpx.AsyncClient) -> httpx.Response:
+    """Send a login request."""
+    return await client.post(LOGIN_PATH, data={"openid": "openid"})
+
+
+async def test_no_errors(start_server: Callable) -> None:
+    """Test the servers answer without injected errors."""
+    server = await start_server(MockConfig(doors=3))
+
+    async with httpx.AsyncClient(base_url=server.url) as client:
+        response = await login(client)
+        token = response.json()["result"]["tokenId"]
+        response = await client.get(DOORS_PATH, params={"tokenId": token})
+
+    assert response.json()["code"] == "200"
+    assert len(response.json()["result"]) == 3
+    assert not server.errors
+
+
+@pytest.mark.parametrize(
+    ("kind", "status_code"), [("429", 429), ("500", 500), ("timeout", 500)]
+)
+async def test_injected_http_errors(
+    start_server: Callable, kind: str, status_code: int
+) -> None:
+    """Test injected HTTP errors reach the client."""
+    server = await start_server(
+        MockConfig(error_rates={kind: 1.0}, retry_after=7, timeout_delay=0.01)
+    )
+
+    async with httpx.AsyncClient(base_url=server.url) as client:
+        response = await login(client)
+
+    assert response.status_code == status_code
+    assert server.errors[f"{LOGIN_PATH} {kind}"] == 1
+    if kind == "429":
+        assert response.headers["Retry-After"] == "7"
+
+
+async def test_injected_token_expiry(start_server: Callable) -> None:
+    """Test injected code 301 reaches the client, logins are not affected."""
+    server = await start_server(MockConfig(error_rates={"301": 1.0}))
+
+    async with httpx.AsyncClient(base_url=server.url) as client:
+        response = await login(client)
+        token = response.json()["result"]["tokenId"]
+        response = await client.get(DOORS_PATH, params={"tokenId": token})
+
+    assert response.json()["code"] == "301"
+    assert server.errors == {f"{DOORS_PATH} 301": 1}
@@ -0,0 +1,127 @@
+"""Tests for the request budgets and retries."""
+
+from __future__ import annotations
+
+import time
+
+import httpx
+import pytest
+
+from custom_components.xiaotu_door.api import API
+from custom_components.xiaotu_door.ratelimit import BUDGET_POLL, TokenBucket
+from custom_components.xiaotu_door.utils import QuotaError
+
+from .conftest import DOORS_PATH, OPEN_DOOR_PATH, FakeXiaoTuServer
+
+
+@pytest.fixture
+def retry_delays(api: API, monkeypatch: pytest.MonkeyPatch) -> list[float | None]:
+    """Get the retry delays of the API, with a backoff of 10ms per attempt.
+
+    The budgets are lifted, so the tests do not wait for them.
+    """
+
+    for name in api.rate_limiter.buckets:
+        api.rate_limiter.buckets[name] = TokenBucket(1e6, 1e6)
+
+    monkeypatch.setattr(
+        "custom_components.xiaotu_door.ratelimit.get_backoff",
+        lambda attempt: attempt * 0.01,
+    )
+
+    delays: list[float | None] = []
+    get_retry_delay = api.rate_limiter.get_retry_delay
+
+    def get_recorded_retry_delay(*args) -> float | None:
+        delays.append(get_retry_delay(*args))
+        return delays[-1]
+
+    monkeypatch.setattr(api.rate_limiter, "get_retry_delay", get_recorded_retry_delay)
+    return delays
+
+
+async def test_token_bucket() -> None:
+    """Test the bucket allows a burst, then spaces the tokens by its rate."""
+    bucket = TokenBucket(rate=2.0, capacity=2)
+
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(0.5, abs=0.01)
+    assert bucket.reserve() == pytest.approx(1.0, abs=0.01)
+
+    bucket.pause(10)
+    assert bucket.reserve() == pytest.approx(10, abs=0.01)
+
+
+async def test_retry_with_backoff(
+    api: API, xiaotu_server: FakeXiaoTuServer, retry_delays: list[float | None]
+) -> None:
+    """Test failed polls are retried with a growing backoff, up to the attempts."""
+    await api.get_auth()
+    xiaotu_server.failures[DOORS_PATH] = [httpx.ReadError("reset")] * 2
+
+    response = await api.get(DOORS_PATH)
+
+    assert response.json()["code"] == "200"
+    assert xiaotu_server.requests[DOORS_PATH] == 3
+    assert retry_delays == [0.01, 0.02]
+
+    retry_delays.clear()
+    xiaotu_server.failures[DOORS_PATH] = [httpx.ReadError("reset")] * 3
+
+    with pytest.raises(httpx.ReadError):
+        await api.get(DOORS_PATH)
+
+    assert xiaotu_server.requests[DOORS_PATH] == 6
+    assert retry_delays == [0.01, 0.02, None]
+
+
+async def test_retry_after(
+    api: API, xiaotu_server: FakeXiaoTuServer, retry_delays: list[float | None]
+) -> None:
+    """Test a quota error is retried after its Retry-After, and pauses polling."""
+    await api.get_auth()
+    xiaotu_server.failures[DOORS_PATH] = [
+        httpx.Response(429, headers={"retry-after": "0.2"})
+    ]
+
+    started_at = time.monotonic()
+    response = await api.get(DOORS_PATH)
+
+    assert response.json()["code"] == "200"
+    assert xiaotu_server.requests[DOORS_PATH] == 2
+    assert retry_delays == [0.2]
+    assert time.monotonic() - started_at >= 0.2
+
+    # Given up, the polls are still held back
+    xiaotu_server.failures[DOORS_PATH] = [
+        httpx.Response(429, headers={"retry-after": "60"})
+    ] * 3
+
+    with pytest.raises(QuotaError):
+        await api.get(DOORS_PATH)
+
+    assert retry_delays[-1] is None
+    assert api.rate_limiter.buckets[BUDGET_POLL].reserve() > 59
+
+
+async def test_sent_unlock_not_retried(
+    api: API, xiaotu_server: FakeXiaoTuServer, retry_delays: list[float | None]
+) -> None:
+    """Test an unlock which reached the servers is never sent again."""
+    await api.get_auth()
+    xiaotu_server.failures[OPEN_DOOR_PATH] = [httpx.ReadTimeout("no response")]
+
+    with pytest.raises(httpx.ReadTimeout):
+        await api.get(OPEN_DOOR_PATH, params={"doorId": "door0"})
+
+    assert xiaotu_server.requests[OPEN_DOOR_PATH] == 1
+    assert retry_delays == [None]
+
+    # Not sent at all, retried
+    xiaotu_server.failures[OPEN_DOOR_PATH] = [httpx.ConnectError("refused")]
+
+    await api.get(OPEN_DOOR_PATH, params={"doorId": "door0"})
+
+    assert xiaotu_server.requests[OPEN_DOOR_PATH] == 3
+    assert xiaotu_server.opened == ["door0"]
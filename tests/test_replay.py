@@ -0,0 +1,51 @@
+"""Tests for the recording and replay of the API traffic."""
+
+from __future__ import annotations
+
+import base64
+from pathlib import Path
+
+from custom_components.xiaotu_door.account import XiaoTuAccount
+
+from .conftest import OPEN_DOOR_PATH, FakeXiaoTuServer
+from .test_dao import get_lock
+
+MOBILE = "13800000000"
+
+
+async def run_session(config: dict) -> XiaoTuAccount:
+    """Set up an account and unlock its first door."""
+
+    account = XiaoTuAccount({"username": "openid", "password": "cid", **config})
+    try:
+        await account.bootstrap()
+        await account.devices[0].push_entity_state(
+            get_lock(account, "door0"), {"is_locked": False}
+        )
+    finally:
+        await account.api.aclose()
+
+    return account
+
+
+async def test_record_replay(tmp_path: Path, xiaotu_server: FakeXiaoTuServer) -> None:
+    """Test a recorded setup and unlock replay without network, and no secrets."""
+    recorded = await run_session({"record_dir": str(tmp_path)})
+    tokens = set(xiaotu_server.tokens)
+    assert tokens
+    assert xiaotu_server.opened == ["door0"]
+
+    fixtures = [path.read_text(encoding="utf-8") for path in tmp_path.iterdir()]
+    assert any(OPEN_DOOR_PATH in fixture for fixture in fixtures)
+    for fixture in fixtures:
+        for secret in (*tokens, MOBILE, base64.b64encode(MOBILE.encode()).decode()):
+            assert secret not in fixture
+
+    requests = xiaotu_server.requests.copy()
+    replayed = await run_session({"replay_dir": str(tmp_path)})
+
+    assert xiaotu_server.requests == requests
+    assert replayed.user.userId == recorded.user.userId
+    assert [entity.as_dict() for entity in replayed.devices[0].entities] == [
+        entity.as_dict() for entity in recorded.devices[0].entities
+    ]